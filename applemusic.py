@@ -1,187 +1,767 @@
 from pathlib import Path
-from typing import Generator, BinaryIO
-from playlist import Playlist, Track, PlaylistReader
+from typing import Generator, BinaryIO, Iterable
+from playlist import Playlist, Track, PlaylistReader, PlaylistSelection, TrackCache
+from collections import Counter
+from collections.abc import Mapping
 import struct
 from urllib.parse import unquote
 from Cryptodome.Cipher import AES
 import zlib
-from io import BytesIO
+import hashlib
+import os
+from io import BytesIO, BufferedReader, RawIOBase
+import mmap
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import multiprocessing
 
 class AppleMusicLibraryDecryptor:
+    # Must stay a multiple of the AES block size so each read can be decrypted on its own
+    CHUNK_SIZE = 1024 * 1024
+
     def __init__(self, key: str, library: Path):
         self.key = key
         self.library = library
 
-    def decrypt(self, debug=False) -> BinaryIO:
+    def read_header(self, inf: BinaryIO, debug=False) -> 'tuple[int, int]':
+        """The envelope length and the size of the encrypted region, reading from the start of the library."""
+        assert inf.read(4) == bytes('hfma', 'ascii')
+        envelope_length, file_size = struct.unpack('<II', inf.read(8))
+        inf.seek(84)
+        max_crypt_size = struct.unpack('<I', inf.read(4))[0]
+
+        if max_crypt_size < file_size:
+            crypt_size = max_crypt_size
+        else:
+            crypt_size = file_size - envelope_length - ((file_size - envelope_length) % 16)
+
+        if debug:
+            print(f'envelope_length: {envelope_length}')
+            print(f'file_size: {file_size}')
+            print(f'max_crypt_size: {max_crypt_size}')
+            print(f'crypt_size: {crypt_size}')
+
+        return envelope_length, crypt_size
+
+    def iter_chunks(self, debug=False, chunk_size=CHUNK_SIZE) -> Generator[bytes, None, None]:
+        """Yield the decrypted library (envelope followed by the decompressed payload) in bounded chunks."""
+        assert chunk_size % AES.block_size == 0
         with self.library.open("rb") as inf:
-            assert inf.read(4) == bytes('hfma', 'ascii')
-            envelope_length, file_size = struct.unpack('<II', inf.read(8))
-            inf.seek(84)
-            max_crypt_size = struct.unpack('<I', inf.read(4))[0]
-
-            if max_crypt_size < file_size:
-                crypt_size = max_crypt_size
-            else:
-                crypt_size = file_size - envelope_length - ((file_size - envelope_length) % 16)
-
-            if debug:
-                print(f'envelope_length: {envelope_length}')
-                print(f'file_size: {file_size}')
-                print(f'max_crypt_size: {max_crypt_size}')
-                print(f'crypt_size: {crypt_size}')
+            envelope_length, crypt_size = self.read_header(inf, debug)
 
             inf.seek(0)
-            out_data = inf.read(envelope_length)
+            yield inf.read(envelope_length)
 
             cipher = AES.new(self.key, AES.MODE_ECB)
-            decrypted = cipher.decrypt(inf.read(crypt_size))
-            compressed_data = decrypted + inf.read()
-
-            out_data += zlib.decompress(compressed_data)
+            decompressor = zlib.decompressobj()
 
-        return BytesIO(out_data)
+            remaining = crypt_size
+            while remaining > 0:
+                block = inf.read(min(chunk_size, remaining))
+                assert len(block) > 0, 'Library ended inside the encrypted region'
+                remaining -= len(block)
+                yield from self._decompress(decompressor, cipher.decrypt(block), chunk_size)
 
-# Made possible by the excellent documentation at https://home.vollink.com/gary/playlister/musicdb.html#lPma
-# And with the iTunes key found at https://gist.github.com/mrexodia/b21b429cdab57fa64e81
-class AppleMusicReader(PlaylistReader):
-    def __init__(self, chunks: 'list[Section]'):
-        self.chunks = chunks
+            while block := inf.read(chunk_size):
+                yield from self._decompress(decompressor, block, chunk_size)
 
-        self._parse_tracks()
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+            assert decompressor.eof, 'Library payload is truncated'
 
-    def _parse_tracks(self):
-        chunk_iter = iter(self.chunks)
-        while True:
-            curr = next(chunk_iter)
-            if isinstance(curr, HSMA) and curr.subtype == 1:
-                break
+    @staticmethod
+    def _decompress(decompressor, data: bytes, chunk_size: int) -> Generator[bytes, None, None]:
+        while data:
+            out = decompressor.decompress(data, chunk_size)
+            if out:
+                yield out
+            data = decompressor.unconsumed_tail
 
-        ltma = next(chunk_iter)
-        assert isinstance(ltma, LTMA)
+    def open(self, debug=False) -> BinaryIO:
+        """Open the library as a read-only stream that decrypts and decompresses on demand."""
+        return BufferedReader(DecryptedLibraryStream(self.iter_chunks(debug)), self.CHUNK_SIZE)
 
-        self.tracks = {}
+    def decrypt(self, debug=False) -> BinaryIO:
+        return BytesIO(b''.join(self.iter_chunks(debug)))
+
+    def probe(self, count_playlists: bool = False) -> 'LibraryProbe':
+        """
+        Check that the library is complete and the key is right, and read its track count, from the envelope and the
+        first decompressed blocks. The playlists follow every track, so counting them decompresses (but does not keep)
+        nearly the whole library. Raises ValueError for a truncated library or the wrong key.
+        """
+        with self.library.open('rb') as inf:
+            envelope = inf.read(LibraryProbe.ENVELOPE_HEADER_LENGTH)
+            if len(envelope) < LibraryProbe.ENVELOPE_HEADER_LENGTH or envelope[0:4] != b'hfma':
+                raise ValueError(f'{self.library} is not an Apple Music library')
+            inf.seek(0)
+            envelope_length, crypt_size = self.read_header(inf)
+            _, file_size = struct.unpack_from('<II', envelope, 4)
+            actual_size = os.fstat(inf.fileno()).st_size
+            if actual_size < file_size:
+                raise ValueError(f'{self.library} is truncated ({actual_size} of {file_size} bytes), it may still be written')
+
+            inf.seek(envelope_length)
+            first_block = AES.new(self.key, AES.MODE_ECB).decrypt(inf.read(AES.block_size))
+            # Every zlib stream starts with a two byte header that is a multiple of 31
+            if first_block[0] & 0x0F != 8 or (first_block[0] << 8 | first_block[1]) % 31 != 0:
+                raise ValueError(f'{self.library} does not decrypt to a zlib stream, the key is wrong')
+
+        version = envelope[16:48].split(b'\0', 1)[0].decode('ascii', 'replace')
+        probe = LibraryProbe(version, envelope_length, file_size, crypt_size)
+
+        chunks = self.iter_chunks(chunk_size=LibraryProbe.CHUNK_SIZE)
+        try:
+            next(chunks)
+            window = PayloadWindow(chunks)
+            # Skip the inner hfma, then go from one hsma block to the next until the counts were found
+            offset, = struct.unpack('<I', window.read(4, 4))
+            while probe.track_count is None or (count_playlists and probe.playlist_count is None):
+                signature, section_length, associated_length = struct.unpack('<4sII', window.read(offset, 12))
+                if signature != b'hsma':
+                    break
+                signature, _, count = struct.unpack('<4sII', window.read(offset + section_length, 12))
+                if signature == b'ltma':
+                    probe.track_count = count
+                elif signature == b'lPma':
+                    probe.playlist_count = count
+                offset += associated_length
+        except EOFError:
+            pass
+        except zlib.error as e:
+            raise ValueError(f'{self.library} is corrupt: {e}')
+        finally:
+            chunks.close()
+
+        return probe
+
+class LibraryProbe:
+    ENVELOPE_HEADER_LENGTH = 88
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, version: str, envelope_length: int, file_size: int, crypt_size: int):
+        self.version = version
+        self.envelope_length = envelope_length
+        self.file_size = file_size
+        self.crypt_size = crypt_size
+        self.track_count: 'int | None' = None
+        self.playlist_count: 'int | None' = None
 
-        track_id = None
-        curr_track = None
+    def __str__(self):
+        return f'LibraryProbe(version="{self.version}", envelope_length={self.envelope_length}, file_size={self.file_size}, crypt_size={self.crypt_size}, track_count={self.track_count}, playlist_count={self.playlist_count})'
 
-        def finalize_track():
-            if track_id is not None:
-                if curr_track.album_artist is None:
-                    curr_track.album_artist = curr_track.track_artist
-                self.tracks[track_id] = curr_track
-
-        while True:
-            curr = next(chunk_iter)
-            if isinstance(curr, HSMA):
-                finalize_track()
-                break
-            elif isinstance(curr, ITMA):
-                finalize_track()
-                track_id = curr.track_id
-                curr_track = Track(None, None, None, None, None, None)
-            elif isinstance(curr, BOMA_TrackNumerics):
-                curr_track.duration = curr.duration_ms
-            elif isinstance(curr, BOMA_URI):
-                assert curr.uri.startswith('file://localhost/')
-                curr_track.location = Path(unquote(curr.uri[len('file://localhost/'):]))
-            elif isinstance(curr, BOMA_String):
-                match(curr.subtype):
-                    case 0x02:
-                        curr_track.track_name = curr.value
-                    case 0x04:
-                        curr_track.track_artist = curr.value
-                    case 0x03:
-                        curr_track.album_name = curr.value
-                    case 0x1B:
-                        curr_track.album_artist = curr.value
-        assert len(self.tracks) == ltma.itma_count, f'unexpected number of tracks parsed ({len(self.tracks)} != {ltma.itma_count})'
-
-    def read_track(self, id: str) -> Track:
-        if id not in self.tracks:
-            raise ValueError(f'Unknown id "{id}"')
+class PayloadWindow:
+    """Random access to a stream of decompressed chunks, as long as reads never go backwards."""
+    def __init__(self, chunks: Generator[bytes, None, None]):
+        self.chunks = chunks
+        self.buffer = bytearray()
+        self.base = 0
+
+    def read(self, offset: int, size: int) -> bytes:
+        assert offset >= self.base
+        while self.base + len(self.buffer) < offset + size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                raise EOFError
+            end = self.base + len(self.buffer)
+            # Drop chunks that are skipped over whole without copying them
+            if end + len(chunk) <= offset:
+                self.buffer.clear()
+                self.base = end + len(chunk)
+                continue
+            self.buffer += chunk
+        del self.buffer[:offset - self.base]
+        self.base = offset
+        return bytes(self.buffer[:size])
+
+class DecryptedLibraryStream(RawIOBase):
+    def __init__(self, chunks: Generator[bytes, None, None]):
+        self.chunks = chunks
+        self.pending = memoryview(b'')
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.pending = memoryview(chunk)
+
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        self.position += count
+        return count
+
+    def close(self):
+        if not self.closed:
+            self.chunks.close()
+            self.pending = memoryview(b'')
+        super().close()
+
+class ParsedLibrary:
+    """
+    What a load of the library leaves for the next load to reuse: the digest and object of every track and
+    playlist it built, without its buffer or index. Filled in as the reader it came from builds more of them.
+    """
+    def __init__(self, built_tracks: 'dict[int, tuple[bytes, Track]]', built_playlists: 'dict[str, tuple[bytes, list[int], Playlist]]'):
+        self.built_tracks = built_tracks
+        self.built_playlists = built_playlists
 
-        return self.tracks[id]
+# Made possible by the excellent documentation at https://home.vollink.com/gary/playlister/musicdb.html#lPma
+# And with the iTunes key found at https://gist.github.com/mrexodia/b21b429cdab57fa64e81
+class AppleMusicReader(PlaylistReader):
+    def __init__(self, index: 'SectionIndex', track_cache: TrackCache = None, source: str = 'Apple Music',
+                 track_spans: 'dict[int, tuple[int, int]]' = None, decoded_tracks: 'dict[int, tuple]' = None,
+                 previous: 'ParsedLibrary' = None, track_digests: bool = False):
+        self.index = index
+        self.source = source
+        self.track_cache = track_cache if track_cache is not None else TrackCache()
+        # Track fields already decoded by the parallel loader, so read_track need not decode them again
+        self.decoded_tracks = decoded_tracks if decoded_tracks is not None else {}
+        self._legacy_ids: 'dict[str, int]' = None
+
+        # Digest of the bytes behind every track and playlist built so far, so the next load can reuse the unchanged ones.
+        # This keeps every built track alive, so it is only done when the reader will be passed as the next load's previous
+        self.track_digests = track_digests or previous is not None
+        self.built_tracks: 'dict[int, tuple[bytes, Track]]' = {}
+        self.built_playlists: 'dict[str, tuple[bytes, list[int], Playlist]]' = {}
+        self.previous_tracks = previous.built_tracks if previous is not None else {}
+        self.previous_playlists = previous.built_playlists if previous is not None else {}
+
+        self._parse_tracks(track_spans)
+
+    def snapshot(self) -> ParsedLibrary:
+        """What the next load needs of this one, to keep between loads instead of the whole reader."""
+        return ParsedLibrary(self.built_tracks, self.built_playlists)
+
+    @property
+    def chunks(self) -> 'list[Section]':
+        return [self.index.section(i) for i in range(len(self.index))]
+
+    @property
+    def tracks(self) -> 'Mapping[int, Track]':
+        return AppleMusicTracks(self)
+
+    def _parse_tracks(self, track_spans: 'dict[int, tuple[int, int]]' = None):
+        index = self.index
+        start = index.find('hsma', 1) + 1
+
+        ltma = index.section(start)
+        assert isinstance(ltma, LTMA)
 
-    def read_playlists(self) -> Generator[Playlist, None, None]:
-        chunk_iter = iter(self.chunks)
-        while True:
-            curr = next(chunk_iter)
-            if isinstance(curr, HSMA) and curr.subtype == 2:
-                break
+        # Index positions of each track's itma section and of the section just past its boma entries
+        if track_spans is None:
+            track_spans = dict(find_track_spans(index, start + 1, len(index)))
+        self.track_spans = track_spans
+        assert len(self.track_spans) == ltma.itma_count, f'unexpected number of tracks parsed ({len(self.track_spans)} != {ltma.itma_count})'
+
+    def resolve_track_id(self, id: 'int | str') -> int:
+        """Accept the string ids earlier versions produced, as well as the zero padded display form."""
+        if isinstance(id, int):
+            return id
+        if self._legacy_ids is None:
+            self._legacy_ids = {legacy_track_id(track_id): track_id for track_id in self.track_spans}
+        if id in self._legacy_ids:
+            return self._legacy_ids[id]
+        try:
+            return int(id, 16)
+        except ValueError:
+            raise ValueError(f'Unknown id "{id}"')
 
-        lpma_master = next(chunk_iter)
+    def read_track(self, id: 'int | str') -> Track:
+        id = self.resolve_track_id(id)
+        built = self.built_tracks.get(id)
+        if built is not None:
+            return built[1]
+
+        if id not in self.track_spans:
+            raise ValueError(f'Unknown id "{format_track_id(id)}"')
+
+        if not self.track_digests:
+            return self._decode_track(id)
+
+        digest = self._digest(*self.track_spans[id])
+        previous = self.previous_tracks.get(id)
+        if previous is not None and previous[0] == digest:
+            track = previous[1]
+        else:
+            # A changed track may still be in the track cache under the same id
+            track = self._decode_track(id, cached=previous is None)
+        self.built_tracks[id] = (digest, track)
+        return track
+
+    def _decode_track(self, id: int, cached: bool = True) -> Track:
+        track = self.track_cache.get((self.source, id)) if cached else None
+        if track is None:
+            fields = self.decoded_tracks.get(id)
+            if fields is None:
+                fields = decode_track_fields(self.index, *self.track_spans[id])
+            track = Track(*fields)
+            self.track_cache.put((self.source, id), track)
+        return track
+
+    def decode_tracks(self):
+        """Decode the fields of every track now rather than as tracks are read, reusing those unchanged since the previous load."""
+        if self.track_digests:
+            # Builds each track once, along with the digest the next load compares against
+            for id in self.track_spans:
+                self.read_track(id)
+            return
+        for id, span in self.track_spans.items():
+            if id not in self.decoded_tracks:
+                self.decoded_tracks[id] = decode_track_fields(self.index, *span)
+
+    def _digest(self, start: int, stop: int) -> bytes:
+        """Digest of the bytes of the sections at index positions start to stop."""
+        index = self.index
+        return hashlib.blake2b(index.buffer[index.offsets[start]:index.offsets[stop - 1] + index.lengths[stop - 1]], digest_size=16).digest()
+
+    def _track_digest(self, id: int) -> bytes:
+        built = self.built_tracks.get(id)
+        if built is not None:
+            return built[0]
+        return self._digest(*self.track_spans[id])
+
+    def _track_unchanged(self, id: int) -> bool:
+        previous = self.previous_tracks.get(id)
+        return previous is not None and id in self.track_spans and previous[0] == self._track_digest(id)
+
+    def _scan_playlists(self) -> 'Generator[tuple[str, list[int], tuple[int, int]], None, None]':
+        """
+        Yield each playlist's title with the index positions of its track entries, without decoding the entries,
+        and the index positions of its lpma section and of the section just past its boma entries.
+        """
+        index = self.index
+        start = index.find('hsma', 2) + 1
+
+        lpma_master = index.section(start)
         assert isinstance(lpma_master, LPMA_Master)
 
         curr_lpma: LPMA = None
+        curr_start: int = None
         curr_title: str = None
         curr_tracks = []
 
         playlist_count = 0
 
-        while True:
-            try:
-                curr = next(chunk_iter)
-            except StopIteration:
-                break
+        def finalize_playlist(stop: int):
+            assert curr_title is not None
+            assert len(curr_tracks) == curr_lpma.track_count, f'Warning: mismatch track count for playlist "{curr_title}", ({len(curr_tracks)} != {curr_lpma.track_count})'
+            return curr_title, curr_tracks, (curr_start, stop)
 
-            if isinstance(curr, HSMA):
+        stop = len(index)
+        for i in range(start + 1, len(index)):
+            signature = index.signatures[i]
+            if signature == SectionIndex.HSMA:
+                stop = i
                 break
-            elif isinstance(curr, LPMA):
+            elif signature == SectionIndex.LPMA:
                 if curr_lpma is not None:
-                    assert curr_title is not None
-                    assert len(curr_tracks) == curr_lpma.track_count, f'Warning: mismatch track count for playlist "{curr_title}", ({len(curr_tracks)} != {curr_lpma.track_count})'
                     playlist_count += 1
-                    yield Playlist(curr_title, [self.read_track(id) for id in curr_tracks])
-                curr_lpma = curr
+                    yield finalize_playlist(i)
+                curr_lpma = index.section(i)
+                curr_start = i
                 curr_tracks = []
                 curr_title = None
-            elif isinstance(curr, BOMA_String):
-                assert curr.subtype == 0xC8, f"Found BOMA_String of unexpected type '{BOMA_String.STRING_TYPES.get(curr.subtype, hex(curr.subtype))}'"
-                curr_title = curr.value
-            elif isinstance(curr, BOMA_PlaylistTrack):
-                curr_tracks.append(curr.track_id)
+            elif signature == SectionIndex.BOMA:
+                subtype = index.subtypes[i]
+                if subtype == 0xCE:
+                    curr_tracks.append(i)
+                elif subtype in BOMA_String.STRING_TYPES:
+                    assert subtype == 0xC8, f"Found BOMA_String of unexpected type '{BOMA_String.STRING_TYPES.get(subtype, hex(subtype))}'"
+                    curr_title = index.section(i).value
 
         if curr_lpma is not None:
-            assert curr_title is not None
-            assert len(curr_tracks) == curr_lpma.track_count, f'Warning: mismatch track count for playlist "{curr_title}", ({len(curr_tracks)} != {curr_lpma.track_count})'
             playlist_count += 1
-            yield Playlist(curr_title, [self.read_track(id) for id in curr_tracks])
+            yield finalize_playlist(stop)
 
         assert playlist_count == lpma_master.lpma_count
 
+    def read_tracks(self) -> Generator[Track, None, None]:
+        for id in self.track_spans:
+            track = self.read_track(id)
+            # Cloud and streamed tracks have no file, so can't be written to a playlist
+            if track.location_str is not None:
+                yield track
+
+    def list_playlist_names(self) -> 'list[str]':
+        return [title for title, _, _ in self._scan_playlists()]
+
+    def read_playlists(self, names: 'Iterable[str] | None' = None) -> Generator[Playlist, None, None]:
+        selection = PlaylistSelection(names)
+        if selection.done:
+            return
+
+        for title, positions, span in self._scan_playlists():
+            if selection.take(title):
+                yield self._build_playlist(title, positions, span)
+                if selection.done:
+                    return
+
+    def _build_playlist(self, title: str, positions: 'list[int]', span: 'tuple[int, int]') -> Playlist:
+        if not self.track_digests:
+            return Playlist(title, [self.read_track(playlist_track_id(self.index, i)) for i in positions])
+
+        digest = self._digest(*span)
+        previous = self.previous_playlists.get(title)
+        # The entries only hold track ids, so the playlist is only reusable if its tracks did not change either
+        if previous is not None and previous[0] == digest and all(self._track_unchanged(id) for id in previous[1]):
+            _, track_ids, plist = previous
+            for id in track_ids:
+                self.built_tracks[id] = self.previous_tracks[id]
+        else:
+            track_ids = [playlist_track_id(self.index, i) for i in positions]
+            plist = Playlist(title, [self.read_track(id) for id in track_ids])
+        self.built_playlists[title] = (digest, track_ids, plist)
+        return plist
+
+    @staticmethod
+    def load_file(file: BinaryIO, track_cache: TrackCache = None, workers: int = 1, previous: 'ParsedLibrary' = None,
+                  track_digests: bool = False) -> 'AppleMusicReader':
+        """
+        Load a decrypted library, reusing the tracks and playlists of previous (an earlier load's snapshot) that did not change.
+        Pass track_digests for a load that will itself be the previous of a later one.
+        """
+        return AppleMusicReader.load_buffer(AppleMusicReader.read_file(file), track_cache, workers, previous, track_digests)
+
+    @staticmethod
+    def read_file(file: BinaryIO):
+        """
+        The whole of a decrypted library as one buffer, which must not outlive file.
+        A decrypting stream avoids holding the encrypted and compressed copies, but the decompressed library
+        itself is collected here: the section index decodes sections from it by offset, so memory grows with its size.
+        """
+        if hasattr(file, 'getbuffer'):
+            return file.getbuffer()
+
+        try:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Not backed by a real file (e.g. a decrypting stream), so collect it into one buffer
+            buffer = bytearray()
+            while chunk := file.read(AppleMusicLibraryDecryptor.CHUNK_SIZE):
+                buffer += chunk
+            return buffer
+
+    @staticmethod
+    def load_buffer(buffer, track_cache: TrackCache = None, workers: int = 1, previous: 'ParsedLibrary' = None,
+                    track_digests: bool = False) -> 'AppleMusicReader':
+        if workers > 1:
+            reader = ParallelSectionParser(buffer, workers).parse(track_cache, previous, track_digests)
+            if reader is not None:
+                return reader
+        return AppleMusicReader(SectionIndex.build(buffer), track_cache, previous=previous, track_digests=track_digests)
+
+class AppleMusicTracks(Mapping):
+    """Read-only view of a reader's tracks by id, decoding each track through the track cache when accessed."""
+    def __init__(self, reader: AppleMusicReader):
+        self.reader = reader
+
+    def __getitem__(self, id: 'int | str') -> Track:
+        try:
+            track_id = self.reader.resolve_track_id(id)
+        except ValueError:
+            raise KeyError(id)
+        if track_id not in self.reader.track_spans:
+            raise KeyError(id)
+        return self.reader.read_track(track_id)
+
+    def __iter__(self):
+        return iter(self.reader.track_spans)
+
+    def __len__(self) -> int:
+        return len(self.reader.track_spans)
+
+class SectionIndex:
+    """Signature, subtype, offset and length of every section, so sections can be decoded on demand."""
+    SIGNATURES = ('hfma', 'hsma', 'boma', 'ltma', 'itma', 'lPma', 'lpma', 'plma', 'lama', 'iama', 'lAma', 'iAma')
+    HFMA, HSMA, BOMA, LTMA, ITMA, LPMA_MASTER, LPMA, PLMA, LAMA, IAMA, LAMA_MASTER, IAMA_MASTER = range(len(SIGNATURES))
+    CODES = {signature.encode('ascii'): code for code, signature in enumerate(SIGNATURES)}
+
+    def __init__(self, buffer: memoryview):
+        self.buffer = buffer
+        self.signatures = array('B')
+        self.subtypes = array('I')
+        self.offsets = array('Q')
+        self.lengths = array('I')
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
     @staticmethod
-    def load_file(file: BinaryIO) -> 'AppleMusicReader':
-        chunks = []
-        while True:
-            offset = file.tell()
-            signature = file.read(4)
-            if len(signature) != 4:
+    def build(buffer) -> 'SectionIndex':
+        index = SectionIndex(memoryview(buffer))
+        index.walk(0, len(index.buffer))
+        return index
+
+    def walk(self, offset: int, stop: int) -> int:
+        """Index the sections starting before stop, returning the offset of the first section not indexed."""
+        view = self.buffer
+        while offset < stop and offset + 8 <= len(view):
+            code = SectionIndex.CODES.get(bytes(view[offset:offset+4]))
+            if code is None:
                 break
-            try:
-                decoded = signature.decode('ascii')
-            except UnicodeDecodeError:
+            if code in (SectionIndex.BOMA, SectionIndex.HSMA) and offset + 16 > len(view):
                 break
-            match decoded:
-                case 'hsma':
-                    chunks.append(HSMA.read_section(offset, file))
-                case 'boma':
-                    chunks.append(BOMA.read_section(offset, file))
-                case 'ltma':
-                    chunks.append(LTMA.read_section(offset, file))
-                case 'itma':
-                    chunks.append(ITMA.read_section(offset, file))
-                case 'lPma':
-                    chunks.append(LPMA_Master.read_section(offset, file))
-                case 'lpma':
-                    chunks.append(LPMA.read_section(offset, file))
-                case 'hfma' | 'plma' | 'lama' | 'iama' | 'lAma' | 'iAma':
-                    chunks.append(Section.read_section(decoded, offset, file))
-                case _:
-                    break
-        return AppleMusicReader(chunks)
+            if code == SectionIndex.BOMA:
+                section_length, subtype = struct.unpack_from('<II', view, offset + 8)
+            elif code == SectionIndex.HSMA:
+                section_length, subtype = struct.unpack_from('<I4xI', view, offset + 4)
+            else:
+                section_length, = struct.unpack_from('<I', view, offset + 4)
+                subtype = 0
+            # A corrupt or half-written library; a section is never shorter than its signature and length
+            if section_length < 8:
+                break
+            self.signatures.append(code)
+            self.subtypes.append(subtype)
+            self.offsets.append(offset)
+            self.lengths.append(section_length)
+            offset += section_length
+        return offset
+
+    def signature_counts(self) -> 'dict[str, int]':
+        return {SectionIndex.SIGNATURES[code]: count for code, count in Counter(self.signatures).items()}
+
+    def find(self, signature: str, subtype: int = None, start: int = 0) -> int:
+        code = SectionIndex.SIGNATURES.index(signature)
+        for i in range(start, len(self)):
+            if self.signatures[i] == code and (subtype is None or self.subtypes[i] == subtype):
+                return i
+        raise ValueError(f'No {signature} section found')
+
+    def section(self, i: int) -> 'Section':
+        signature = SectionIndex.SIGNATURES[self.signatures[i]]
+        offset = self.offsets[i]
+        match signature:
+            case 'hsma':
+                return HSMA.from_buffer(self.buffer, offset)
+            case 'boma':
+                return BOMA.from_buffer(self.buffer, offset)
+            case 'ltma':
+                return LTMA.from_buffer(self.buffer, offset)
+            case 'itma':
+                return ITMA.from_buffer(self.buffer, offset)
+            case 'lPma':
+                return LPMA_Master.from_buffer(self.buffer, offset)
+            case 'lpma':
+                return LPMA.from_buffer(self.buffer, offset)
+            case _:
+                return Section.from_buffer(signature, self.buffer, offset)
+
+def format_track_id(track_id: int) -> str:
+    return f'{track_id:016X}'
+
+def legacy_track_id(track_id: int) -> str:
+    """The string id of earlier versions: each byte in file order, in hex without padding."""
+    return ''.join(f'{d:X}' for d in track_id.to_bytes(8, 'little'))
+
+def playlist_track_id(index: 'SectionIndex', i: int) -> int:
+    """Read the track id of a playlist entry straight from the buffer, without decoding the section."""
+    magic, track_id = struct.unpack_from('<4s16xQ', index.buffer, index.offsets[i] + BOMA_PlaylistTrack.MAGIC_OFFSET)
+    assert magic == b'ipfa'
+    return track_id
+
+def find_track_spans(index: 'SectionIndex', start: int, stop: int) -> 'Generator[tuple[int, tuple[int, int]], None, None]':
+    """Yield each track id with the index positions of its itma section and of the section just past its boma entries."""
+    track_id = None
+    track_start = None
+
+    for i in range(start, stop):
+        signature = index.signatures[i]
+        if signature == SectionIndex.HSMA:
+            stop = i
+            break
+        elif signature == SectionIndex.ITMA:
+            if track_id is not None:
+                yield track_id, (track_start, i)
+            track_id, = struct.unpack_from('<Q', index.buffer, index.offsets[i] + ITMA.TRACK_ID_OFFSET)
+            track_start = i
+    if track_id is not None:
+        yield track_id, (track_start, stop)
+
+def decode_track_fields(index: 'SectionIndex', start: int, stop: int) -> tuple:
+    """Decode the boma entries of one track into the arguments of Track, in order."""
+    fields = dict.fromkeys(('track_name', 'track_artist', 'album_name', 'album_artist', 'location', 'duration'))
+    for i in range(start + 1, stop):
+        if index.signatures[i] != SectionIndex.BOMA:
+            continue
+        match index.subtypes[i]:
+            case 0x01:
+                fields['duration'] = index.section(i).duration_ms
+            case 0x0B:
+                uri = index.section(i).uri
+                assert uri.startswith('file://localhost/')
+                fields['location'] = unquote(uri[len('file://localhost/'):])
+            case 0x02:
+                fields['track_name'] = index.section(i).value
+            case 0x04:
+                fields['track_artist'] = index.section(i).value
+            case 0x03:
+                fields['album_name'] = index.section(i).value
+            case 0x1B:
+                fields['album_artist'] = index.section(i).value
+    if fields['album_artist'] is None:
+        fields['album_artist'] = fields['track_artist']
+    return tuple(fields.values())
+
+# Set in each worker process of ParallelSectionParser
+_shared_library = None
+
+def _attach_shared_library(name: str, size: int):
+    global _shared_library
+    shm = shared_memory.SharedMemory(name)
+    _shared_library = (shm, shm.buf[:size])
+
+def _parse_piece(piece: 'tuple[int, int, bool]') -> tuple:
+    start, stop, decode_tracks = piece
+    index = SectionIndex(_shared_library[1])
+    end = index.walk(start, stop)
+
+    spans = []
+    fields = []
+    if decode_tracks:
+        # The first piece of the track block also holds its hsma and ltma sections
+        first = next((i for i in range(len(index)) if index.signatures[i] == SectionIndex.ITMA), len(index))
+        for track_id, span in find_track_spans(index, first, len(index)):
+            spans.append((track_id, span))
+            fields.append(decode_track_fields(index, *span))
+
+    return end, index.signatures.tobytes(), index.subtypes.tobytes(), index.offsets.tobytes(), index.lengths.tobytes(), spans, fields
+
+class ParallelSectionParser:
+    """
+    Parses a decrypted library in a process pool. The buffer is copied once into shared memory and split
+    at hsma blocks, with the track block further split at itma sections, so each worker indexes one piece
+    and decodes the tracks in it. The pieces are merged into the same index a serial parse would build.
+    """
+    # How many sections from a candidate split point must chain up before it is trusted
+    CANDIDATE_SECTIONS = 4
+
+    def __init__(self, buffer, workers: int):
+        self.view = memoryview(buffer)
+        self.workers = workers
+
+    def _find(self, needle: bytes, start: int, stop: int) -> int:
+        window = 1024 * 1024
+        while start < stop:
+            found = bytes(self.view[start:min(start + window + len(needle), stop)]).find(needle)
+            if found != -1:
+                return start + found
+            start += window
+        return -1
+
+    def _plan(self) -> 'list[tuple[int, int, bool]] | None':
+        view = self.view
+
+        # Skip the envelope and inner hfma to reach the first hsma block
+        offset = 0
+        while offset + 16 <= len(view) and bytes(view[offset:offset+4]) != b'hsma':
+            if bytes(view[offset:offset+4]) not in SectionIndex.CODES:
+                return None
+            length_offset = 8 if bytes(view[offset:offset+4]) == b'boma' else 4
+            section_length, = struct.unpack_from('<I', view, offset + length_offset)
+            if section_length < 8:
+                return None
+            offset += section_length
+
+        # Each hsma's associated length covers its whole block, which leads to the next hsma
+        pieces = [(0, offset, False)]
+        while offset + 16 <= len(view) and bytes(view[offset:offset+4]) == b'hsma':
+            associated_length, subtype = struct.unpack_from('<II', view, offset + 8)
+            if associated_length == 0:
+                return None
+            block_stop = min(offset + associated_length, len(view))
+            if subtype == 1:
+                pieces += self._split_tracks(offset, block_stop)
+            else:
+                pieces.append((offset, block_stop, False))
+            offset = block_stop
+        if offset < len(view):
+            pieces.append((offset, len(view), False))
+        return pieces
+
+    def _is_itma(self, offset: int, stop: int) -> bool:
+        """Whether the "itma" at offset starts a section, rather than being part of a string such as "Whitman"."""
+        view = self.view
+        for _ in range(ParallelSectionParser.CANDIDATE_SECTIONS):
+            if offset == stop:
+                return True
+            if offset + 16 > stop:
+                return False
+            signature = bytes(view[offset:offset+4])
+            if signature not in SectionIndex.CODES:
+                return False
+            length_offset = 8 if signature == b'boma' else 4
+            section_length, = struct.unpack_from('<I', view, offset + length_offset)
+            if section_length < 16 or offset + section_length > stop:
+                return False
+            offset += section_length
+        return True
+
+    def _split_tracks(self, start: int, stop: int) -> 'list[tuple[int, int, bool]]':
+        bounds = [start]
+        for part in range(1, self.workers):
+            found = self._find(b'itma', max(bounds[-1] + 1, start + (stop - start) * part // self.workers), stop)
+            # Skip "itma" inside strings; a candidate that still slips through is noticed by the merge, which falls back to a serial parse
+            while found != -1 and not self._is_itma(found, stop):
+                found = self._find(b'itma', found + 1, stop)
+            if found == -1:
+                break
+            bounds.append(found)
+        bounds.append(stop)
+        return [(lo, hi, True) for lo, hi in zip(bounds, bounds[1:]) if lo < hi]
+
+    def parse(self, track_cache: TrackCache = None, previous: 'ParsedLibrary' = None, track_digests: bool = False) -> 'AppleMusicReader | None':
+        """Parse the library, or return None when it cannot be split safely and should be parsed serially."""
+        pieces = self._plan()
+        if pieces is None:
+            return None
+
+        shm = shared_memory.SharedMemory(create=True, size=max(len(self.view), 1))
+        try:
+            shm.buf[:len(self.view)] = self.view
+            # The iTunes library may be loading on another thread, and forking a process with threads can deadlock it
+            with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_attach_shared_library, initargs=(shm.name, len(self.view))) as pool:
+                results = list(pool.map(_parse_piece, pieces))
+        finally:
+            shm.close()
+            shm.unlink()
+
+        index = SectionIndex(self.view)
+        track_spans = {}
+        decoded_tracks = {}
+        for (start, stop, _), (end, signatures, subtypes, offsets, lengths, spans, fields), next_piece in zip(pieces, results, pieces[1:] + [None]):
+            base = len(index)
+            index.signatures.frombytes(signatures)
+            index.subtypes.frombytes(subtypes)
+            index.offsets.frombytes(offsets)
+            index.lengths.frombytes(lengths)
+            for (track_id, (span_start, span_stop)), track_fields in zip(spans, fields):
+                track_spans[track_id] = (base + span_start, base + span_stop)
+                decoded_tracks[track_id] = track_fields
+
+            if end < stop:
+                # The stream ends inside this piece, just as it would for a serial parse
+                break
+            if next_piece is not None and end != next_piece[0]:
+                return None
+
+        return AppleMusicReader(index, track_cache, track_spans=track_spans, decoded_tracks=decoded_tracks, previous=previous,
+                               track_digests=track_digests)
 
 class Section:
-    def __init__(self, signature: str, offset: int, section_length: int, data: bytes):
+    def __init__(self, signature: str, offset: int, section_length: int, data: memoryview):
         self.signature = signature
         self.offset = offset
         self.section_length = section_length
@@ -191,20 +771,20 @@ class Section:
         return f'Section(signature={self.signature}, offset=0x{self.offset:x}, length=0x{self.section_length:x})'
 
     @staticmethod
-    def read_section(signature: str, offset: int, file: BinaryIO) -> 'Section':
-        section_length, = struct.unpack('<I', file.read(4))
-        data = file.read(section_length - 8)
+    def from_buffer(signature: str, buffer: memoryview, offset: int) -> 'Section':
+        section_length, = struct.unpack_from('<I', buffer, offset + 4)
+        data = buffer[offset+8:offset+section_length]
         return Section(signature, offset, section_length, data)
 
 class BOMA(Section):
-    def __init__(self, offset: int, section_length: int, data: bytes, subtype: int):
+    def __init__(self, offset: int, section_length: int, data: memoryview, subtype: int):
         super().__init__('boma', offset, section_length, data)
         self.subtype = subtype
 
     @staticmethod
-    def read_section(offset: int, file: BinaryIO) -> 'BOMA':
-        constant, section_length, subtype = struct.unpack('<III', file.read(12))
-        data = file.read(section_length - 16)
+    def from_buffer(buffer: memoryview, offset: int) -> 'BOMA':
+        section_length, subtype = struct.unpack_from('<II', buffer, offset + 8)
+        data = buffer[offset+16:offset+section_length]
 
         if subtype in BOMA_String.STRING_TYPES:
             return BOMA_String.parse_section(offset, section_length, data, subtype)
@@ -264,72 +844,74 @@ class BOMA_String(BOMA):
         0x02BF: 'Song Artist (Application.musicdb)',
     }
 
-    def __init__(self, offset: int, section_length: int, data: bytes, subtype: int, value: str):
+    def __init__(self, offset: int, section_length: int, data: memoryview, subtype: int, value: str):
         super().__init__(offset, section_length, data, subtype)
         self.value = value
 
     @staticmethod
-    def parse_section(offset: int, section_length: int, data: bytes, subtype: int):
-        bytelength,  = struct.unpack('<I', data[8:12])
-        str_bytes = data[20:bytelength+20]
-        value = str_bytes.decode('utf-16')
+    def parse_section(offset: int, section_length: int, data: memoryview, subtype: int):
+        bytelength, = struct.unpack_from('<I', data, 8)
+        value = str(data[20:bytelength+20], 'utf-16')
         return BOMA_String(offset, section_length, data, subtype, value)
 
     def __str__(self):
         return f'BOMA_String(offset=0x{self.offset:x}, length=0x{self.section_length:x}, label="{BOMA_String.STRING_TYPES[self.subtype]}", value="{self.value}")'
 
 class BOMA_PlaylistTrack(BOMA):
-    def __init__(self, offset: int, section_length: int, data: bytes, track_id: str):
+    # Offset of the 'ipfa' marker from the start of the section; the track id follows 16 bytes later
+    MAGIC_OFFSET = 20
+
+    def __init__(self, offset: int, section_length: int, data: memoryview, track_id: int):
         super().__init__(offset, section_length, data, 0xCE)
         self.track_id = track_id
 
     @staticmethod
-    def parse_section(offset: int, section_length: int, data: bytes):
+    def parse_section(offset: int, section_length: int, data: memoryview):
         assert data[4:8] == 'ipfa'.encode('ascii')
 
-        track_id  = ''.join(f'{d:X}' for d in data[24:32])
+        track_id, = struct.unpack_from('<Q', data, 24)
         return BOMA_PlaylistTrack(offset, section_length, data, track_id)
 
     def __str__(self):
-        return f'BOMA_PlaylistTrack(offset=0x{self.offset:x}, length=0x{self.section_length:x}, track_id="{self.track_id}")'
+        return f'BOMA_PlaylistTrack(offset=0x{self.offset:x}, length=0x{self.section_length:x}, track_id="{format_track_id(self.track_id)}")'
 
 class BOMA_URI(BOMA):
-    def __init__(self, offset: int, section_length: int, data: bytes, uri: str):
+    def __init__(self, offset: int, section_length: int, data: memoryview, uri: str):
         super().__init__(offset, section_length, data, 0x0B)
         self.uri = uri
 
     @staticmethod
-    def parse_section(offset: int, section_length: int, data: bytes):
-        uri_length, = struct.unpack('<I', data[8:12])
-        uri = data[20:uri_length+20].decode('utf-8')
+    def parse_section(offset: int, section_length: int, data: memoryview):
+        uri_length, = struct.unpack_from('<I', data, 8)
+        uri = str(data[20:uri_length+20], 'utf-8')
         return BOMA_URI(offset, section_length, data, uri)
 
     def __str__(self):
         return f'BOMA_URI(offset=0x{self.offset:x}, length=0x{self.section_length:x}, uri="{self.uri}")'
 
 class BOMA_TrackNumerics(BOMA):
-    def __init__(self, offset: int, section_length: int, data: bytes, duration_ms: int):
+    def __init__(self, offset: int, section_length: int, data: memoryview, duration_ms: int):
         super().__init__(offset, section_length, data, 0x01)
         self.duration_ms = duration_ms
 
     @staticmethod
-    def parse_section(offset: int, section_length: int, data: bytes):
-        duration_ms, = struct.unpack('<I', data[160:164])
+    def parse_section(offset: int, section_length: int, data: memoryview):
+        duration_ms, = struct.unpack_from('<I', data, 160)
         return BOMA_TrackNumerics(offset, section_length, data, duration_ms)
 
     def __str__(self):
         return f'BOMA_TrackNumerics(offset=0x{self.offset:x}, length=0x{self.section_length:x}, duration_ms="{self.duration_ms}")'
 
 class HSMA(Section):
-    def __init__(self, offset: int, section_length: int, data: bytes, associated_length: int, subtype: int):
+    def __init__(self, offset: int, section_length: int, data: memoryview, associated_length: int, subtype: int):
         super().__init__('hsma', offset, section_length, data)
         self.associated_length = associated_length
         self.subtype = subtype
 
     @staticmethod
-    def read_section(offset, file):
-        section = Section.read_section('hsma', offset, file)
-        associated_length, subtype = struct.unpack('<II', section.data[:8])
+    def from_buffer(buffer: memoryview, offset: int) -> 'HSMA':
+        section = Section.from_buffer('hsma', buffer, offset)
+        associated_length, subtype = struct.unpack_from('<II', section.data)
         return HSMA(section.offset, section.section_length, section.data, associated_length, subtype)
 
     def __str__(self):
@@ -344,99 +926,62 @@ class HSMA(Section):
         return f'HSMA(offset=0x{self.offset:x}, length=0x{self.section_length:x}, associated_length=0x{self.associated_length}, subtype="{subtypes.get(self.subtype, hex(self.subtype))}")'
 
 class LTMA(Section):
-    def __init__(self, offset: int, section_length: int, data: bytes, itma_count: int):
+    def __init__(self, offset: int, section_length: int, data: memoryview, itma_count: int):
         super().__init__('ltma', offset, section_length, data)
         self.itma_count = itma_count
 
     @staticmethod
-    def read_section(offset, file):
-        section = Section.read_section('ltma', offset, file)
-        itma_count, = struct.unpack('<I', section.data[:4])
+    def from_buffer(buffer: memoryview, offset: int) -> 'LTMA':
+        section = Section.from_buffer('ltma', buffer, offset)
+        itma_count, = struct.unpack_from('<I', section.data)
         return LTMA(section.offset, section.section_length, section.data, itma_count)
 
     def __str__(self):
         return f'LTMA(offset=0x{self.offset:x}, length=0x{self.section_length:x}, itma_count:{self.itma_count})'
 
 class ITMA(Section):
-    def __init__(self, offset: int, section_length: int, data: bytes, track_id: str, track_no: int):
+    # Offset of the track id from the start of the section
+    TRACK_ID_OFFSET = 16
+
+    def __init__(self, offset: int, section_length: int, data: memoryview, track_id: int, track_no: int):
         super().__init__('itma', offset, section_length, data)
         self.track_id = track_id
         self.track_no = track_no
 
     @staticmethod
-    def read_section(offset, file):
-        section = Section.read_section('itma', offset, file)
-        track_id = ''.join(f'{d:X}' for d in section.data[8:16])
-        track_no, = struct.unpack('<H', section.data[152:154])
+    def from_buffer(buffer: memoryview, offset: int) -> 'ITMA':
+        section = Section.from_buffer('itma', buffer, offset)
+        track_id, = struct.unpack_from('<Q', section.data, 8)
+        track_no, = struct.unpack_from('<H', section.data, 152)
         return ITMA(section.offset, section.section_length, section.data, track_id, track_no)
 
     def __str__(self):
-        return f'ITMA(offset=0x{self.offset:x}, length=0x{self.section_length:x}, track_id="{self.track_id}", track_no={self.track_no})'
+        return f'ITMA(offset=0x{self.offset:x}, length=0x{self.section_length:x}, track_id="{format_track_id(self.track_id)}", track_no={self.track_no})'
 
 class LPMA_Master(Section):
-    def __init__(self, offset: int, section_length: int, data: bytes, lpma_count: int):
+    def __init__(self, offset: int, section_length: int, data: memoryview, lpma_count: int):
         super().__init__('lPma', offset, section_length, data)
         self.lpma_count = lpma_count
 
     @staticmethod
-    def read_section(offset, file):
-        section = Section.read_section('lPma', offset, file)
-        lpma_count, = struct.unpack('<I', section.data[0:4])
+    def from_buffer(buffer: memoryview, offset: int) -> 'LPMA_Master':
+        section = Section.from_buffer('lPma', buffer, offset)
+        lpma_count, = struct.unpack_from('<I', section.data)
         return LPMA_Master(section.offset, section.section_length, section.data, lpma_count)
 
     def __str__(self):
         return f'LPMA_Master(offset=0x{self.offset:x}, length=0x{self.section_length:x}, lpma_count={self.lpma_count})'
 
 class LPMA(Section):
-    def __init__(self, offset: int, section_length: int, data: bytes, track_count: int):
+    def __init__(self, offset: int, section_length: int, data: memoryview, track_count: int):
         super().__init__('lpma', offset, section_length, data)
         self.track_count = track_count
 
     @staticmethod
-    def read_section(offset, file):
-        section = Section.read_section('lpma', offset, file)
-        track_count, = struct.unpack('<I', section.data[8:12])
+    def from_buffer(buffer: memoryview, offset: int) -> 'LPMA':
+        section = Section.from_buffer('lpma', buffer, offset)
+        track_count, = struct.unpack_from('<I', section.data, 8)
         return LPMA(section.offset, section.section_length, section.data, track_count)
 
     def __str__(self):
         return f'LPMA(offset=0x{self.offset:x}, length=0x{self.section_length:x}, track_count={self.track_count})'
-
-
-if __name__ == '__main__':
-    scriptdir = Path(__file__).parent
-    infile = scriptdir / 'Library.musicdb'
-    assert infile.is_file()
-
-    keyfile = scriptdir / 'itunes-key.txt'
-    assert keyfile.exists(), f"Missing keyfile at {keyfile}"
-
-    decrypted = scriptdir / 'Library.musicdb.bin'
-    if decrypted.is_file():
-        decrypted.unlink()
-
-    chunks = scriptdir / 'DEBUG_chunks.txt'
-    tracks = scriptdir / 'DEBUG_tracks.txt'
-    playlists = scriptdir / 'DEBUG_playlists.txt'
-
-    with keyfile.open('r') as inf:
-        key = inf.read().strip()
-        key = key.encode('ascii')
-
-    with decrypted.open('wb') as outf:
-        outf.write(AppleMusicLibraryDecryptor(key, infile).decrypt(True).read())
-
-    with decrypted.open('rb') as inf:
-        reader = AppleMusicReader.load_file(inf)
-
-    with chunks.open('w', encoding='utf-8') as outf:
-        for chunk in reader.chunks:
-            print(chunk, file=outf)
-
-    with tracks.open('w', encoding='utf-8') as outf:
-        for id, track in reader.tracks.items():
-            print(f'{id} - {str(track)}', file=outf)
-
-    with playlists.open('w', encoding='utf-8') as outf:
-        for plist in reader.read_playlists():
-            print(plist, file=outf)
-            print(file=outf)
@@ -0,0 +1,223 @@
+"""
+Times each stage of the sync on synthetic libraries, e.g. `python benchmark.py --sizes 1000 10000 --memory`.
+The libraries are generated with a random key, so neither a real library nor the iTunes key is needed.
+"""
+from pathlib import Path
+from typing import Callable
+from urllib.parse import quote
+from Cryptodome.Cipher import AES
+import argparse
+import functools
+import json
+import os
+import plistlib
+import random
+import struct
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+from applemusic import AppleMusicLibraryDecryptor, AppleMusicReader, SectionIndex, decode_track_fields
+from itunes import iTunesReader
+from output import PlaylistOutput
+from playlist import TrackCache
+
+class SyntheticLibrary:
+    """Deterministic library with the same tracks and playlists in musicdb and iTunes XML form."""
+    # The size of the encrypted prefix in the libraries Apple Music writes
+    MAX_CRYPT_SIZE = 0x19000
+
+    def __init__(self, track_count: int, playlist_count: int = 50, playlist_length: int = 200, seed: int = 0):
+        self.track_count = track_count
+        self.playlist_count = playlist_count
+        self.playlist_length = min(playlist_length, track_count)
+
+        rng = random.Random(seed)
+        self.track_ids = [rng.getrandbits(64) for _ in range(track_count)]
+        self.playlists = [
+            (f'Playlist {number}', rng.sample(range(track_count), self.playlist_length))
+            for number in range(playlist_count)
+        ]
+
+    def track_fields(self, number: int) -> dict:
+        return {
+            'Name': f'Track {number}',
+            'Artist': f'Artist {number % 997}',
+            'Album': f'Album {number % 4999}',
+            'Album Artist': f'Artist {number % 997}',
+            'Location': f'C:/Music/Artist {number % 997}/Album {number % 4999}/{number:06} Track {number}.m4a',
+            'Total Time': 120_000 + number % 240_000,
+        }
+
+    @staticmethod
+    def _section(signature: bytes, body: bytes) -> bytes:
+        return signature + struct.pack('<I', len(body) + 8) + body
+
+    @staticmethod
+    def _boma(subtype: int, body: bytes) -> bytes:
+        return b'boma' + struct.pack('<III', 0x14, len(body) + 16, subtype) + body
+
+    @staticmethod
+    def _boma_string(subtype: int, value: str, encoding: str = 'utf-16-le') -> bytes:
+        encoded = value.encode(encoding)
+        return SyntheticLibrary._boma(subtype, struct.pack('<IIIII', 1, 0, len(encoded), 0, 0) + encoded)
+
+    def _track_sections(self, number: int) -> bytes:
+        fields = self.track_fields(number)
+
+        itma = bytearray(160)
+        struct.pack_into('<Q', itma, 8, self.track_ids[number])
+        struct.pack_into('<H', itma, 152, number % 0x10000)
+
+        numerics = bytearray(200)
+        struct.pack_into('<I', numerics, 160, fields['Total Time'])
+
+        return b''.join((
+            self._section(b'itma', bytes(itma)),
+            self._boma(0x01, bytes(numerics)),
+            self._boma_string(0x02, fields['Name']),
+            self._boma_string(0x03, fields['Album']),
+            self._boma_string(0x04, fields['Artist']),
+            self._boma_string(0x1B, fields['Album Artist']),
+            # Decoded by nothing, but present in every real library
+            self._boma_string(0x05, 'Genre'),
+            self._boma_string(0x1E, fields['Name']),
+            self._boma_string(0x0B, 'file://localhost/' + quote(fields['Location']), 'utf-8'),
+        ))
+
+    def _playlist_sections(self, name: str, numbers: 'list[int]') -> bytes:
+        entries = []
+        for number in numbers:
+            entry = bytearray(40)
+            entry[4:8] = b'ipfa'
+            struct.pack_into('<Q', entry, 24, self.track_ids[number])
+            entries.append(self._boma(0xCE, bytes(entry)))
+        return self._section(b'lpma', struct.pack('<III', 0, 0, len(numbers)) + bytes(8)) + self._boma_string(0xC8, name) + b''.join(entries)
+
+    def _hsma_block(self, subtype: int, content: bytes) -> bytes:
+        header_length = 24
+        return self._section(b'hsma', struct.pack('<II', header_length + len(content), subtype) + bytes(8)) + content
+
+    def musicdb_payload(self) -> bytes:
+        tracks = self._section(b'ltma', struct.pack('<I', self.track_count) + bytes(8))
+        tracks += b''.join(self._track_sections(number) for number in range(self.track_count))
+
+        playlists = self._section(b'lPma', struct.pack('<I', self.playlist_count) + bytes(8))
+        playlists += b''.join(self._playlist_sections(name, numbers) for name, numbers in self.playlists)
+
+        return self._section(b'hfma', bytes(40)) + self._hsma_block(1, tracks) + self._hsma_block(2, playlists)
+
+    def write_musicdb(self, path: Path, key: bytes):
+        compressed = zlib.compress(self.musicdb_payload())
+
+        envelope_length = 104
+        file_size = envelope_length + len(compressed)
+        envelope = bytearray(envelope_length)
+        envelope[0:4] = b'hfma'
+        struct.pack_into('<II', envelope, 4, envelope_length, file_size)
+        struct.pack_into('<I', envelope, 84, SyntheticLibrary.MAX_CRYPT_SIZE)
+
+        if SyntheticLibrary.MAX_CRYPT_SIZE < file_size:
+            crypt_size = SyntheticLibrary.MAX_CRYPT_SIZE
+        else:
+            crypt_size = len(compressed) - len(compressed) % 16
+
+        with path.open('wb') as outf:
+            outf.write(envelope)
+            outf.write(AES.new(key, AES.MODE_ECB).encrypt(compressed[:crypt_size]))
+            outf.write(compressed[crypt_size:])
+
+    def write_itunes(self, path: Path):
+        tracks = {}
+        for number in range(self.track_count):
+            fields = self.track_fields(number)
+            fields['Location'] = 'file://localhost/' + quote(fields['Location'])
+            tracks[str(number)] = {'Track ID': number, **fields, 'Genre': 'Genre', 'Play Count': number % 50}
+
+        playlists = [
+            {'Name': name, 'Playlist ID': 100 + index, 'Playlist Items': [{'Track ID': number} for number in numbers]}
+            for index, (name, numbers) in enumerate(self.playlists)
+        ]
+
+        with path.open('wb') as outf:
+            # Keep the key order iTunes writes, with Tracks before Playlists
+            plistlib.dump({'Major Version': 1, 'Tracks': tracks, 'Playlists': playlists}, outf, sort_keys=False)
+
+class StageTimer:
+    def __init__(self, memory: bool):
+        self.memory = memory
+        self.results: 'dict[str, dict]' = {}
+
+    def run(self, stage: str, work: Callable):
+        """Run one stage, recording its wall time and, if enabled, the peak memory it allocated."""
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = work()
+        elapsed = time.perf_counter() - start
+        self.results[stage] = {'seconds': round(elapsed, 4)}
+        if self.memory:
+            self.results[stage]['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+            tracemalloc.stop()
+        return result
+
+def benchmark(track_count: int, directory: Path, memory: bool) -> 'dict[str, dict]':
+    library = SyntheticLibrary(track_count)
+    key = os.urandom(16)
+    musicdb_path = directory / f'Library-{track_count}.musicdb'
+    itunes_path = directory / f'Library-{track_count}.xml'
+    library.write_musicdb(musicdb_path, key)
+    library.write_itunes(itunes_path)
+
+    timer = StageTimer(memory)
+    decryptor = AppleMusicLibraryDecryptor(key, musicdb_path)
+    names = [name for name, _ in library.playlists]
+
+    def decrypt():
+        with musicdb_path.open('rb') as inf:
+            envelope_length, crypt_size = decryptor.read_header(inf)
+            inf.seek(envelope_length)
+            return AES.new(key, AES.MODE_ECB).decrypt(inf.read(crypt_size)) + inf.read()
+
+    compressed = timer.run('decrypt', decrypt)
+    payload = timer.run('decompress', functools.partial(zlib.decompress, compressed))
+    del compressed
+    timer.run('decrypt_streamed', lambda: sum(len(chunk) for chunk in decryptor.iter_chunks()))
+
+    index = timer.run('section_parse', lambda: SectionIndex.build(payload))
+    reader = timer.run('track_spans', lambda: AppleMusicReader(index, TrackCache(track_count)))
+    timer.run('track_assembly', lambda: [decode_track_fields(index, *span) for span in reader.track_spans.values()])
+    playlists = timer.run('playlist_resolution', lambda: list(reader.read_playlists(names)))
+
+    itunes = iTunesReader(itunes_path, TrackCache(track_count))
+    timer.run('itunes_playlist_resolution', lambda: list(itunes.read_playlists(names)))
+
+    output_directory = directory / f'zpl-{track_count}'
+    output_directory.mkdir()
+    timer.run('zpl_write', lambda: PlaylistOutput(output_directory).sync(playlists))
+
+    return timer.results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sync pipeline on synthetic libraries.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 500_000], help='track counts to benchmark')
+    parser.add_argument('--memory', action='store_true', help='also record the peak memory of each stage (slows every stage down)')
+    parser.add_argument('--json', type=Path, help='write the results to this file as JSON')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            results[size] = benchmark(size, Path(directory), args.memory)
+            print(f'{size} tracks:')
+            for stage, measured in results[size].items():
+                peak = f", peak {measured['peak_mb']} MB" if 'peak_mb' in measured else ''
+                print(f"  {stage:<28} {measured['seconds']:>9.4f} s{peak}")
+
+    if args.json is not None:
+        with args.json.open('w') as outf:
+            json.dump(results, outf, indent=4)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+from pathlib import Path
+from typing import Generator, Iterable, Optional
+from playlist import Playlist, Track, PlaylistReader, PlaylistSelection, TrackCache
+from array import array
+import hashlib
+import sqlite3
+
+class LibraryFingerprint:
+    def __init__(self, size: int, mtime_ns: int, digest: Optional[str] = None):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.digest = digest
+
+    @staticmethod
+    def stat(library: Path) -> 'LibraryFingerprint':
+        stat = library.stat()
+        return LibraryFingerprint(stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def content_digest(library: Path) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        with library.open('rb') as inf:
+            while chunk := inf.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def take(library: Path) -> 'LibraryFingerprint':
+        """Stat and digest library before it is parsed, trying again if it is written while being digested."""
+        while True:
+            fingerprint = LibraryFingerprint.stat(library)
+            fingerprint.digest = LibraryFingerprint.content_digest(library)
+            current = LibraryFingerprint.stat(library)
+            if (current.size, current.mtime_ns) == (fingerprint.size, fingerprint.mtime_ns):
+                return fingerprint
+
+class LibraryCache:
+    """Parsed tracks and playlists of each library, stored in SQLite and keyed on the library's fingerprint."""
+    SCHEMA_VERSION = 3
+    # The columns smart playlists filter on; text is matched ignoring case
+    INDEXED_COLUMNS = ('track_artist', 'album_name', 'album_artist', 'duration')
+
+    def __init__(self, path: Path):
+        # Watch mode keeps readers between syncs, which run their queries on new loader threads
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != LibraryCache.SCHEMA_VERSION:
+            self._create_schema()
+
+    def _create_schema(self):
+        with self.db:
+            # Several connections may open a fresh cache at once; only the first one to get the lock creates it
+            self.db.execute('BEGIN IMMEDIATE')
+            if self.db.execute('PRAGMA user_version').fetchone()[0] == LibraryCache.SCHEMA_VERSION:
+                return
+            for table in ('sources', 'tracks', 'playlists', 'playlist_tracks'):
+                self.db.execute(f'DROP TABLE IF EXISTS {table}')
+            self.db.execute('CREATE TABLE sources (source TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)')
+            self.db.execute('''
+                CREATE TABLE tracks (
+                    source TEXT, id INTEGER,
+                    track_name TEXT, track_artist TEXT, album_name TEXT, album_artist TEXT, location TEXT, duration INTEGER,
+                    PRIMARY KEY (source, id)
+                )
+            ''')
+            for column in LibraryCache.INDEXED_COLUMNS:
+                collation = ' COLLATE NOCASE' if column != 'duration' else ''
+                self.db.execute(f'CREATE INDEX tracks_{column} ON tracks ({column}{collation})')
+            self.db.execute('CREATE TABLE playlists (source TEXT, id INTEGER, name TEXT, digest BLOB, PRIMARY KEY (source, id))')
+            self.db.execute('''
+                CREATE TABLE playlist_tracks (
+                    source TEXT, playlist_id INTEGER, position INTEGER, track_id INTEGER,
+                    PRIMARY KEY (source, playlist_id, position)
+                ) WITHOUT ROWID
+            ''')
+            self.db.execute(f'PRAGMA user_version = {LibraryCache.SCHEMA_VERSION}')
+
+    def close(self):
+        self.db.close()
+
+    def is_valid(self, source: str, library: Path) -> bool:
+        row = self.db.execute('SELECT size, mtime_ns, digest FROM sources WHERE source = ?', (source,)).fetchone()
+        if row is None:
+            return False
+
+        size, mtime_ns, digest = row
+        current = LibraryFingerprint.stat(library)
+        if current.size != size:
+            return False
+        if current.mtime_ns == mtime_ns:
+            return True
+
+        # Same size but touched since the last parse; only the content can tell whether it really changed
+        if LibraryFingerprint.content_digest(library) != digest:
+            return False
+        with self.db:
+            self.db.execute('UPDATE sources SET mtime_ns = ? WHERE source = ?', (current.mtime_ns, source))
+        return True
+
+    def load(self, source: str, library: Path, track_cache: TrackCache = None) -> Optional['CachedReader']:
+        if not self.is_valid(source, library):
+            return None
+        return CachedReader(self.db, source, track_cache)
+
+    def store(self, source: str, library: Path, reader: PlaylistReader, track_cache: TrackCache = None,
+              fingerprint: LibraryFingerprint = None) -> 'CachedReader':
+        """
+        Store what reader parsed from library. If the reader has already parsed it, pass the fingerprint taken
+        before parsing, so a library written in the meantime is not recorded as matching the old content.
+        """
+        if fingerprint is None:
+            fingerprint = LibraryFingerprint.take(library)
+
+        # Only what changed since the library was last stored is written: tracks keep their row while their details
+        # are the same, and playlists are rewritten only when their name or tracks changed
+        stored_ids: 'dict[tuple, int]' = {}
+        for id, *fields in self.db.execute('''
+            SELECT id, track_name, track_artist, album_name, album_artist, location, duration FROM tracks WHERE source = ?
+        ''', (source,)):
+            stored_ids[tuple(fields)] = id
+        stored_playlists = {id: (name, digest) for id, name, digest in self.db.execute('SELECT id, name, digest FROM playlists WHERE source = ?', (source,))}
+        next_id = max(stored_ids.values(), default=-1) + 1
+
+        # Keyed on the track's details, so a track is stored once however many playlists it is in
+        track_ids: 'dict[tuple, int]' = {}
+        track_rows = []
+        playlist_rows = []
+        entry_rows = []
+        playlist_count = 0
+
+        def track_id(track: Track) -> int:
+            nonlocal next_id
+            fields = (track.track_name, track.track_artist, track.album_name, track.album_artist, track.location_str, track.duration)
+            id = track_ids.get(fields)
+            if id is None:
+                id = stored_ids.get(fields)
+                if id is None:
+                    id = next_id
+                    next_id += 1
+                    track_rows.append((source, id) + fields)
+                track_ids[fields] = id
+            return id
+
+        for playlist_id, playlist in enumerate(reader.read_playlists()):
+            playlist_count += 1
+            ids = array('q', (track_id(track) for track in playlist.tracks))
+            digest = hashlib.blake2b(ids.tobytes(), digest_size=16).digest()
+            if stored_playlists.get(playlist_id) == (playlist.name, digest):
+                continue
+            playlist_rows.append((source, playlist_id, playlist.name, digest))
+            entry_rows += ((source, playlist_id, position, id) for position, id in enumerate(ids))
+        # Smart playlists may pick any track of the library, not only those in a playlist
+        for track in reader.read_tracks():
+            track_id(track)
+
+        removed_tracks = [(source, id) for fields, id in stored_ids.items() if fields not in track_ids]
+        changed_playlists = [(source, id) for _, id, _, _ in playlist_rows] + [(source, id) for id in stored_playlists if id >= playlist_count]
+
+        with self.db:
+            self.db.execute('DELETE FROM sources WHERE source = ?', (source,))
+            self.db.executemany('DELETE FROM tracks WHERE source = ? AND id = ?', removed_tracks)
+            self.db.executemany('DELETE FROM playlists WHERE source = ? AND id = ?', changed_playlists)
+            self.db.executemany('DELETE FROM playlist_tracks WHERE source = ? AND playlist_id = ?', changed_playlists)
+            self.db.executemany('INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?)', track_rows)
+            self.db.executemany('INSERT INTO playlists VALUES (?, ?, ?, ?)', playlist_rows)
+            self.db.executemany('INSERT INTO playlist_tracks VALUES (?, ?, ?, ?)', entry_rows)
+            self.db.execute('INSERT INTO sources VALUES (?, ?, ?, ?)', (source, fingerprint.size, fingerprint.mtime_ns, fingerprint.digest))
+
+        return CachedReader(self.db, source, track_cache)
+
+    def find_tracks(self, source: str, conditions: 'list[str]', parameters: list) -> Generator[Track, None, None]:
+        """Yield the tracks of source that have a file and match all of the SQL conditions on the tracks table."""
+        where = ''.join(f' AND ({condition})' for condition in conditions)
+        rows = self.db.execute(f'''
+            SELECT track_name, track_artist, album_name, album_artist, location, duration
+            FROM tracks WHERE source = ? AND location IS NOT NULL{where}
+        ''', (source, *parameters))
+        for row in rows:
+            yield Track(*row)
+
+class CachedReader(PlaylistReader):
+    def __init__(self, db: sqlite3.Connection, source: str, track_cache: TrackCache = None):
+        self.db = db
+        self.source = source
+        self.track_cache = track_cache if track_cache is not None else TrackCache()
+
+    def _make_track(self, row) -> Track:
+        id, track_name, track_artist, album_name, album_artist, location, duration = row
+        key = ('cache', self.source, id)
+        track = self.track_cache.get(key)
+        if track is None:
+            track = Track(
+                track_name,
+                track_artist,
+                album_name,
+                album_artist,
+                location,
+                duration
+            )
+            self.track_cache.put(key, track)
+        return track
+
+    def read_track(self, id: int) -> Track:
+        row = self.db.execute('''
+            SELECT id, track_name, track_artist, album_name, album_artist, location, duration
+            FROM tracks WHERE source = ? AND id = ?
+        ''', (self.source, id)).fetchone()
+        if row is None:
+            raise ValueError(f'Invalid track id {id}')
+        return self._make_track(row)
+
+    def _read_playlist(self, playlist_id: int, name: str) -> Playlist:
+        rows = self.db.execute('''
+            SELECT t.id, t.track_name, t.track_artist, t.album_name, t.album_artist, t.location, t.duration
+            FROM playlist_tracks p JOIN tracks t ON t.source = p.source AND t.id = p.track_id
+            WHERE p.source = ? AND p.playlist_id = ?
+            ORDER BY p.position
+        ''', (self.source, playlist_id))
+        return Playlist(name, [self._make_track(row) for row in rows])
+
+    def read_tracks(self) -> Generator[Track, None, None]:
+        rows = self.db.execute('''
+            SELECT id, track_name, track_artist, album_name, album_artist, location, duration
+            FROM tracks WHERE source = ? ORDER BY id
+        ''', (self.source,))
+        for row in rows:
+            yield self._make_track(row)
+
+    def list_playlist_names(self) -> 'list[str]':
+        return [name for name, in self.db.execute('SELECT name FROM playlists WHERE source = ? ORDER BY id', (self.source,))]
+
+    def read_playlists(self, names: 'Iterable[str] | None' = None) -> Generator[Playlist, None, None]:
+        selection = PlaylistSelection(names)
+        if selection.done:
+            return
+
+        playlists = self.db.execute('SELECT id, name FROM playlists WHERE source = ? ORDER BY id', (self.source,)).fetchall()
+        for playlist_id, name in playlists:
+            if selection.take(name):
+                yield self._read_playlist(playlist_id, name)
+                if selection.done:
+                    return
@@ -1,47 +1,176 @@
 from pathlib import Path
-import plistlib
-from typing import Generator
-from playlist import Playlist, Track, PlaylistReader
+from typing import Callable, Generator, Iterable
+from playlist import Playlist, Track, PlaylistReader, PlaylistSelection, TrackCache, intern_name
 from urllib.parse import unquote
+from xml.etree import ElementTree
 
 class iTunesReader(PlaylistReader):
-    def __init__(self, library: Path):
-        with library.open('rb') as inf:
-            self.library = plistlib.load(inf, fmt=plistlib.FMT_XML)
+    # Only the fields a Track is built from are kept, in this order
+    TRACK_FIELDS = ('Name', 'Artist', 'Album', 'Album Artist', 'Location', 'Total Time')
+    INTERNED_FIELDS = ('Artist', 'Album', 'Album Artist')
 
-        self.track_cache: 'dict[int, Track]' = {}
+    def __init__(self, library: Path, track_cache: TrackCache = None):
+        self.library = library
+        self.source = str(library)
+        self.tracks: 'dict[int, tuple]' = {}
+        self.tracks_loaded = False
+
+        self.track_cache = track_cache if track_cache is not None else TrackCache()
+
+    @staticmethod
+    def _plist_value(elem: ElementTree.Element):
+        match elem.tag:
+            case 'integer':
+                return int(elem.text)
+            case 'string':
+                return elem.text or ''
+            case 'true':
+                return True
+            case 'false':
+                return False
+            case _:
+                return elem.text
+
+    @staticmethod
+    def _plist_pairs(elem: ElementTree.Element) -> Generator[tuple, None, None]:
+        children = list(elem)
+        for key, value in zip(children[::2], children[1::2]):
+            yield key.text, value
+
+    def _add_track(self, elem: ElementTree.Element):
+        fields = dict.fromkeys(iTunesReader.TRACK_FIELDS)
+        track_id = None
+        for key, value in self._plist_pairs(elem):
+            if key == 'Track ID':
+                track_id = int(value.text)
+            elif key in fields:
+                fields[key] = self._plist_value(value)
+        for key in iTunesReader.INTERNED_FIELDS:
+            fields[key] = intern_name(fields[key])
+        if track_id is not None:
+            self.tracks[track_id] = tuple(fields.values())
+
+    def _read_playlist_data(self, elem: ElementTree.Element, wanted: 'Callable[[str], bool]') -> dict:
+        pairs = dict(self._plist_pairs(elem))
+        data = {}
+        if 'Name' in pairs:
+            data['Name'] = self._plist_value(pairs['Name'])
+            # Only the track ids of playlists someone asked for are worth collecting
+            if 'Playlist Items' in pairs and wanted(data['Name']):
+                data['Playlist Items'] = [int(item.find('integer').text) for item in pairs['Playlist Items']]
+        return data
+
+    def _stream(self, wanted: 'Callable[[str], bool]' = lambda name: True, load_tracks=True) -> Generator[dict, None, None]:
+        """Stream the library, filling the track table and yielding each playlist's name and track ids as they are parsed."""
+        load_tracks = load_tracks and not self.tracks_loaded
+        depth = 0
+        last_key = None
+        section = None
+        container = None
+        # iTunes writes Tracks before Playlists, but hold back any playlist seen before the track table is complete
+        pending: 'list[dict]' = []
+
+        for event, elem in ElementTree.iterparse(self.library, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                # The values of the top-level plist dict, e.g. the Tracks dict and the Playlists array
+                if depth == 3 and elem.tag != 'key':
+                    section = last_key
+                    container = elem
+                continue
+
+            if depth == 3:
+                if elem.tag == 'key':
+                    last_key = elem.text
+                elif section == 'Tracks' and load_tracks:
+                    self.tracks_loaded = True
+                    yield from pending
+                    pending.clear()
+                section = None
+                container = None
+                elem.clear()
+            elif depth == 4 and elem.tag == 'dict':
+                if section == 'Tracks':
+                    if load_tracks and not self.tracks_loaded:
+                        self._add_track(elem)
+                    container.clear()
+                elif section == 'Playlists':
+                    data = self._read_playlist_data(elem, wanted)
+                    container.clear()
+                    if self.tracks_loaded or not load_tracks:
+                        yield data
+                    else:
+                        pending.append(data)
+            depth -= 1
+
+        yield from pending
+
+    def _load_tracks(self):
+        for _ in self._stream():
+            break
 
     def read_track(self, id: int) -> Track:
-        if id in self.track_cache:
-            return self.track_cache[id]
+        track = self.track_cache.get((self.source, id))
+        if track is not None:
+            return track
+
+        if not self.tracks_loaded:
+            self._load_tracks()
 
-        if str(id) not in self.library['Tracks']:
+        if id not in self.tracks:
             raise ValueError(f'Invalid track id {id}')
 
-        track = self.library['Tracks'][str(id)]
-        location = track['Location']
-        assert location.startswith('file://localhost/')
-        location = Path(unquote(location[len('file://localhost/'):]))
+        fields = dict(zip(iTunesReader.TRACK_FIELDS, self.tracks[id]))
+        missing = [key for key, value in fields.items() if value is None]
+        if missing:
+            raise KeyError(missing[0])
 
-        assert location.is_file(), f"File not found: {location}"
+        location = fields['Location']
+        assert location.startswith('file://localhost/')
+        location = unquote(location[len('file://localhost/'):])
 
-        return Track(
-            track['Name'],
-            track['Artist'],
-            track['Album'],
-            track['Album Artist'],
+        track = Track(
+            fields['Name'],
+            fields['Artist'],
+            fields['Album'],
+            fields['Album Artist'],
             location,
-            track['Total Time']
+            fields['Total Time']
         )
+        self.track_cache.put((self.source, id), track)
+        return track
+
+    def read_tracks(self) -> Generator[Track, None, None]:
+        if not self.tracks_loaded:
+            self._load_tracks()
+        for id in list(self.tracks):
+            try:
+                yield self.read_track(id)
+            except (AssertionError, KeyError):
+                # Streams and tracks without a file can't be written to a playlist
+                continue
 
     def _parse_playlist(self, data):
-        tracks = [self.read_track(item['Track ID']) for item in data['Playlist Items']]
+        tracks = [self.read_track(id) for id in data['Playlist Items']]
         return Playlist(data['Name'], tracks)
 
-    def read_playlists(self) -> Generator[Playlist, None, None]:
-        for playlist in self.library['Playlists']:
+    def list_playlist_names(self) -> 'list[str]':
+        return [data['Name'] for data in self._stream(lambda name: False, load_tracks=False) if 'Name' in data]
+
+    def read_playlists(self, names: 'Iterable[str] | None' = None) -> Generator[Playlist, None, None]:
+        selection = PlaylistSelection(names)
+        if selection.done:
+            return
+
+        for playlist in self._stream(selection.wants):
+            if not selection.wants(playlist.get('Name', '')):
+                continue
             try:
-                yield self._parse_playlist(playlist)
+                parsed = self._parse_playlist(playlist)
             except (ValueError, AssertionError, KeyError) as e:
                 # print(f'Skipping {playlist['Name']} due to {repr(e)}')
-                pass
+                continue
+            selection.take(parsed.name)
+            yield parsed
+            if selection.done:
+                return
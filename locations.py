@@ -0,0 +1,60 @@
+from bisect import bisect_right
+from typing import Mapping
+
+class LocationMapper:
+    """
+    Rewrites track locations whose start matches a rule, for libraries whose files have moved to another drive or host.
+    The longest matching prefix wins; prefixes ignore case and the kind of path separator.
+    """
+    def __init__(self, rules: 'Mapping[str, str]'):
+        keyed = sorted((self._key(prefix).rstrip('/'), target.rstrip('/\\')) for prefix, target in rules.items())
+        self.prefixes = [prefix for prefix, _ in keyed]
+        self.targets = [target for _, target in keyed]
+        # Every distinct location is only mapped once, however many playlists (or syncs, in watch mode) it is in
+        self.mapped: 'dict[str, str]' = {}
+
+    @staticmethod
+    def _key(location: str) -> str:
+        key = location.replace('\\', '/')
+        lowered = key.lower()
+        # A few characters change length when lowered, which would misplace the end of the prefix
+        return lowered if len(lowered) == len(key) else key
+
+    def _match(self, location: str) -> int:
+        """Index of the longest prefix of location, or -1."""
+        key = location
+        while True:
+            i = bisect_right(self.prefixes, key) - 1
+            if i < 0:
+                return -1
+            prefix = self.prefixes[i]
+            if key.startswith(prefix):
+                # Only whole folder names match, so C:/Music does not rewrite C:/Music2
+                if len(location) == len(prefix) or location[len(prefix)] == '/':
+                    return i
+                # A rule for the root folder is stored as an empty prefix, and nothing is shorter than that
+                if not prefix:
+                    return -1
+                key = prefix[:-1]
+                continue
+            # Any shorter prefix of key that matches must also be a prefix of the one found, so narrow key to what they share
+            shared = 0
+            while shared < len(prefix) and prefix[shared] == key[shared]:
+                shared += 1
+            key = key[:shared]
+
+    def map(self, location: 'str | None') -> 'str | None':
+        if location is None or not self.prefixes:
+            return location
+        mapped = self.mapped.get(location)
+        if mapped is None:
+            i = self._match(self._key(location))
+            if i < 0:
+                mapped = location
+            else:
+                target = self.targets[i]
+                separator = '\\' if '\\' in target else '/'
+                rest = location[len(self.prefixes[i]):].replace('\\', '/').replace('/', separator)
+                mapped = target + rest
+            self.mapped[location] = mapped
+        return mapped
@@ -0,0 +1,94 @@
+from typing import Hashable
+from playlist import Playlist, Track
+from locations import LocationMapper
+import unicodedata
+
+class MergeConflict:
+    """A track that two sources both have, but with different details; the kept track is the one written."""
+    def __init__(self, kept: Track, other: Track, fields: 'list[str]'):
+        self.kept = kept
+        self.other = other
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return f"{self.kept} (differs in {', '.join(self.fields)} from {self.other})"
+
+class MergeIndex:
+    """
+    One list of the tracks of every source, so a file that is in several libraries is one Track object.
+    Tracks are matched on their normalized location, and tracks of different sources also on their
+    album artist, album, title and duration. The first source to add a track decides its details.
+    Locations are rewritten by the mapper, if any, before they are matched.
+    """
+    FIELDS = ('track_name', 'track_artist', 'album_name', 'album_artist', 'location', 'duration')
+    SUMMARY_LIMIT = 20
+
+    def __init__(self, mapper: LocationMapper = None):
+        self.mapper = mapper
+        # The first track added for each row, which every playlist that has the file shares
+        self.tracks: 'list[Track]' = []
+        self.by_location: 'dict[str, int]' = {}
+        self.by_metadata: 'dict[tuple, int]' = {}
+        self.row_sources: 'dict[int, Hashable]' = {}
+        # Keyed on the row and the other source's details, so a track in several playlists is reported once
+        self.conflicts: 'dict[tuple, MergeConflict]' = {}
+
+    @staticmethod
+    def location_key(location: 'str | None') -> 'str | None':
+        if location is None:
+            return None
+        # Both libraries point at Windows paths, which ignore case and may use either separator
+        return unicodedata.normalize('NFC', location.replace('\\', '/')).casefold()
+
+    @staticmethod
+    def metadata_key(track: Track) -> 'tuple | None':
+        if track.track_name is None or track.duration is None:
+            return None
+        return tuple(value.casefold() if value is not None else None for value in (track.album_artist, track.album_name, track.track_name)) + (track.duration,)
+
+    def _fields(self, track: Track) -> tuple:
+        return (track.track_name, track.track_artist, track.album_name, track.album_artist, self.location_key(track.location_str), track.duration)
+
+    def add(self, track: Track, source: Hashable) -> int:
+        """Return the row of track, adding it unless a source already added the same file."""
+        if self.mapper is not None:
+            mapped = self.mapper.map(track.location_str)
+            if mapped != track.location_str:
+                track = Track(track.track_name, track.track_artist, track.album_name, track.album_artist, mapped, track.duration)
+
+        location = self.location_key(track.location_str)
+        metadata = self.metadata_key(track)
+
+        row = self.by_location.get(location) if location is not None else None
+        if row is None and metadata is not None:
+            row = self.by_metadata.get(metadata)
+            # Within one library, matching details are two copies of a song rather than the same file
+            if row is not None and self.row_sources[row] == source:
+                row = None
+
+        if row is None:
+            row = len(self.tracks)
+            self.tracks.append(track)
+            self.row_sources[row] = source
+        else:
+            kept = self.tracks[row]
+            ours, theirs = self._fields(kept), self._fields(track)
+            if ours != theirs and (row, theirs) not in self.conflicts:
+                fields = [name for name, a, b in zip(MergeIndex.FIELDS, ours, theirs) if a != b]
+                self.conflicts[row, theirs] = MergeConflict(kept, track, fields)
+
+        if location is not None:
+            self.by_location.setdefault(location, row)
+        if metadata is not None:
+            self.by_metadata.setdefault(metadata, row)
+        return row
+
+    def merge(self, plist: Playlist, source: Hashable) -> Playlist:
+        return Playlist(plist.name, [self.tracks[self.add(track, source)] for track in plist.tracks])
+
+    def summary(self) -> str:
+        lines = [f'{len(self.conflicts)} tracks differ between the libraries, kept the details of the first library:']
+        lines += ['  ' + str(conflict) for conflict in list(self.conflicts.values())[:MergeIndex.SUMMARY_LIMIT]]
+        if len(self.conflicts) > MergeIndex.SUMMARY_LIMIT:
+            lines.append(f'  ... and {len(self.conflicts) - MergeIndex.SUMMARY_LIMIT} more')
+        return '\n'.join(lines)
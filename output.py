@@ -0,0 +1,149 @@
+from pathlib import Path
+from typing import Callable, Iterable, TextIO
+from playlist import Playlist
+from writers import PlaylistWriter, ZPLWriter
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+import hashlib
+import json
+import os
+import secrets
+
+def playlist_digest(plist: Playlist) -> str:
+    digest = hashlib.blake2b(plist.name.encode('utf-8'), digest_size=16)
+    for track in plist.tracks:
+        fields = (str(track.location_str), track.album_name, track.album_artist, track.track_name, track.track_artist, str(track.duration))
+        digest.update('\0'.join(fields).encode('utf-8', 'surrogatepass'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def _create_temp(path: Path) -> 'tuple[int, Path]':
+    """Create a new file next to path with the mode a plain open() would give it, as the umask is applied on creation."""
+    while True:
+        temp_path = path.with_name(f'{path.name}{secrets.token_hex(4)}.tmp')
+        try:
+            return os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), temp_path
+        except FileExistsError:
+            continue
+
+def write_atomic(path: Path, write: 'Callable[[TextIO], None]', encoding: 'str | None' = None):
+    fd, temp_path = _create_temp(path)
+    try:
+        with os.fdopen(fd, 'w', buffering=1024 * 1024, encoding=encoding) as outf:
+            write(outf)
+        # Keep the mode of the file it replaces
+        try:
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+class SyncResult:
+    def __init__(self):
+        self.written: 'list[str]' = []
+        self.skipped: 'list[str]' = []
+        self.removed: 'list[str]' = []
+        # Still configured but not found this time, e.g. skipped by a reader; their files are left as they were
+        self.kept: 'list[str]' = []
+        self.bytes_written = 0
+
+    def __str__(self) -> str:
+        out = f'{len(self.written)} playlists written, {len(self.skipped)} unchanged, {len(self.removed)} removed'
+        if self.kept:
+            out += f", {len(self.kept)} not found and kept from the last sync ({', '.join(self.kept)})"
+        return out
+
+class PlaylistOutput:
+    """
+    Writes playlists in one format, skipping any whose content matches what the previous sync wrote.
+    Playlists are rendered by the caller and written by a few I/O threads, so slow (e.g. network) directories
+    don't hold up rendering; at most QUEUE_PER_WORKER rendered playlists per thread wait to be written.
+    """
+    QUEUE_PER_WORKER = 2
+
+    def __init__(self, directory: Path, writer: PlaylistWriter = None, io_workers: int = 4, configured: 'Iterable[str] | None' = None):
+        self.directory = directory
+        # The names of the playlists still asked for; when given, only playlists no longer asked for are removed
+        self.configured = set(name.lower() for name in configured) if configured is not None else None
+        self.writer = writer if writer is not None else ZPLWriter()
+        self.writer.begin()
+        # One manifest per format, so several formats can share a directory
+        self.manifest_path = directory / f'.playlist-sync-{self.writer.name}.json'
+        self.previous = self._load_manifest()
+        self.manifest: 'dict[str, dict]' = {}
+        self.result = SyncResult()
+        self.io_workers = io_workers
+        self.pool = ThreadPoolExecutor(io_workers, thread_name_prefix=f'{self.writer.name}-writer')
+        self.queue: 'deque[tuple[str, str, Future]]' = deque()
+
+    def _load_manifest(self) -> 'dict[str, dict]':
+        if not self.manifest_path.is_file():
+            return {}
+        try:
+            with self.manifest_path.open('r', encoding='utf-8') as inf:
+                return json.load(inf)
+        except ValueError:
+            return {}
+
+    def write(self, plist: Playlist):
+        file_name = plist.name + self.writer.extension
+        out_path = self.directory / file_name
+        digest = playlist_digest(plist)
+
+        entry = self.previous.get(file_name)
+        if entry is not None and entry['digest'] == digest and out_path.is_file() and out_path.stat().st_size == entry['size']:
+            self.manifest[file_name] = entry
+            self.result.skipped.append(plist.name)
+            return
+
+        content = self.writer.render(plist)
+        if len(self.queue) >= self.io_workers * PlaylistOutput.QUEUE_PER_WORKER:
+            self._wait()
+        self.queue.append((file_name, digest, self.pool.submit(self._write_file, out_path, content)))
+        self.result.written.append(plist.name)
+
+    def _write_file(self, out_path: Path, content: str) -> int:
+        write_atomic(out_path, lambda outf: outf.write(content), self.writer.encoding)
+        return out_path.stat().st_size
+
+    def _wait(self):
+        """Wait for the oldest queued write and record it in the manifest."""
+        file_name, digest, future = self.queue.popleft()
+        size = future.result()
+        self.manifest[file_name] = {'digest': digest, 'size': size}
+        self.result.bytes_written += size
+
+    def finish(self) -> SyncResult:
+        """Remove playlists that are no longer synced and record what was written."""
+        try:
+            while self.queue:
+                self._wait()
+        finally:
+            self.pool.shutdown()
+
+        # Only remove playlists this tool wrote itself, never ones it has no record of
+        for file_name in self.previous.keys() - self.manifest.keys():
+            name = file_name[:-len(self.writer.extension)]
+            if self.configured is not None and name.lower() in self.configured:
+                self.manifest[file_name] = self.previous[file_name]
+                self.result.kept.append(name)
+                continue
+            stale_path = self.directory / file_name
+            if stale_path.is_file():
+                stale_path.unlink()
+            self.result.removed.append(name)
+
+        write_atomic(self.manifest_path, lambda outf: json.dump(self.manifest, outf, indent=4))
+        return self.result
+
+    def close(self):
+        """Give up on the sync, leaving the directory and the manifest as the previous sync left them."""
+        self.pool.shutdown()
+
+    def sync(self, playlists: 'list[Playlist]') -> SyncResult:
+        for plist in playlists:
+            self.write(plist)
+        return self.finish()
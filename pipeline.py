@@ -0,0 +1,54 @@
+from typing import Callable, Generator, Iterable
+from playlist import Playlist, PlaylistReader
+from merge import MergeIndex
+from concurrent.futures import ThreadPoolExecutor
+import queue
+
+def resolve_playlists(loaders: 'list[Callable[[], PlaylistReader]]', names: 'Iterable[str]',
+                      merge_index: MergeIndex = None) -> Generator[Playlist, None, None]:
+    """
+    Load every source in its own thread and yield each requested playlist as soon as it is final.
+    Sources earlier in the list win when several have a playlist with the same name, so a later source's
+    playlists are held back until every earlier source has finished.
+    With a merge index, the yielded playlists share one track for each file that several sources have.
+    """
+    names = set(name.lower() for name in names)
+    results = queue.Queue()
+
+    def run(rank: int, loader: 'Callable[[], PlaylistReader]'):
+        try:
+            reader = loader()
+            for plist in reader.read_playlists(names):
+                results.put((rank, plist, None))
+        except BaseException as e:
+            results.put((rank, None, e))
+            return
+        results.put((rank, None, None))
+
+    pending: 'list[list[Playlist]]' = [[] for _ in loaders]
+    done = [False] * len(loaders)
+    claimed: 'set[str]' = set()
+
+    with ThreadPoolExecutor(len(loaders)) as pool:
+        for rank, loader in enumerate(loaders):
+            pool.submit(run, rank, loader)
+
+        while not all(done):
+            rank, plist, error = results.get()
+            if error is not None:
+                raise error
+            if plist is None:
+                done[rank] = True
+            else:
+                pending[rank].append(plist)
+
+            for rank in range(len(loaders)):
+                for plist in pending[rank]:
+                    if plist.name.lower() not in claimed:
+                        claimed.add(plist.name.lower())
+                        if merge_index is not None:
+                            plist = merge_index.merge(plist, rank)
+                        yield plist
+                pending[rank].clear()
+                if not done[rank]:
+                    break
@@ -1,20 +1,40 @@
 from pathlib import Path
 from abc import ABC, abstractmethod
-from typing import Generator
+from typing import Callable, Generator, Hashable, Iterable
+from collections import OrderedDict
+from array import array
+import sys
+import threading
+
+def intern_name(value: 'str | None') -> 'str | None':
+    """Share one copy of names that repeat across many tracks, such as artists and albums."""
+    return sys.intern(value) if value is not None else None
 
 class Track:
-    def __init__(self, track_name: str, track_artist: str, album_name: str, album_artist: str, location: Path, duration: int):
+    __slots__ = ('track_name', 'track_artist', 'album_name', 'album_artist', 'location_str', 'duration')
+
+    def __init__(self, track_name: str, track_artist: str, album_name: str, album_artist: str, location: 'Path | str', duration: int):
         self.track_name = track_name
-        self.track_artist = track_artist
-        self.album_name = album_name
-        self.album_artist = album_artist
+        self.track_artist = intern_name(track_artist)
+        self.album_name = intern_name(album_name)
+        self.album_artist = intern_name(album_artist)
         self.location = location
         self.duration = duration
 
+    @property
+    def location(self) -> 'Path | None':
+        return Path(self.location_str) if self.location_str is not None else None
+
+    @location.setter
+    def location(self, location: 'Path | str | None'):
+        self.location_str = str(location) if location is not None else None
+
     def __str__(self) -> str:
         return f"{self.album_artist} - {self.album_name} - {self.track_name} - {str(self.location)}"
 
 class Playlist:
+    __slots__ = ('name', 'tracks')
+
     def __init__(self, name: str, tracks: 'list[Track]'):
         self.name = name
         self.tracks = tracks
@@ -25,11 +45,145 @@ class Playlist:
             out += '  ' + str(track) + '\n'
         return out
 
+class TrackTable:
+    """
+    Columnar storage for many tracks, with identical tracks stored once and addressed by row index.
+    Optional: the sync itself shares Track objects through MergeIndex and does not use it, nor IndexedPlaylist.
+    """
+    def __init__(self):
+        self.track_names: 'list[str]' = []
+        self.track_artists: 'list[str]' = []
+        self.album_names: 'list[str]' = []
+        self.album_artists: 'list[str]' = []
+        self.locations: 'list[str | None]' = []
+        self.durations = array('q')
+        self.rows: 'dict[tuple, int]' = {}
+
+    def __len__(self) -> int:
+        return len(self.durations)
+
+    def add(self, track: Track) -> int:
+        key = (track.track_name, track.track_artist, track.album_name, track.album_artist, track.location_str, track.duration)
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.durations)
+            self.track_names.append(track.track_name)
+            self.track_artists.append(track.track_artist)
+            self.album_names.append(track.album_name)
+            self.album_artists.append(track.album_artist)
+            self.locations.append(track.location_str)
+            self.durations.append(track.duration if track.duration is not None else -1)
+        return row
+
+    def __getitem__(self, row: int) -> Track:
+        duration = self.durations[row]
+        return Track(
+            self.track_names[row],
+            self.track_artists[row],
+            self.album_names[row],
+            self.album_artists[row],
+            self.locations[row],
+            duration if duration != -1 else None
+        )
+
+class IndexedPlaylist:
+    """A playlist stored as row indices into a TrackTable instead of a list of Track objects."""
+    __slots__ = ('name', 'table', 'rows')
+
+    def __init__(self, name: str, table: TrackTable, rows: 'Iterable[int]' = ()):
+        self.name = name
+        self.table = table
+        self.rows = array('I', rows)
+
+    @staticmethod
+    def from_playlist(plist: Playlist, table: TrackTable) -> 'IndexedPlaylist':
+        return IndexedPlaylist(plist.name, table, (table.add(track) for track in plist.tracks))
+
+    @property
+    def tracks(self) -> 'list[Track]':
+        return [self.table[row] for row in self.rows]
+
+    def __str__(self) -> str:
+        return str(Playlist(self.name, self.tracks))
+
+class TrackCache:
+    """Bounded table of resolved tracks shared by all readers, evicting the least recently used track when full."""
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self.tracks: 'OrderedDict[Hashable, Track]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Readers may resolve tracks from several threads at once
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def get(self, key: Hashable) -> 'Track | None':
+        with self.lock:
+            track = self.tracks.get(key)
+            if track is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.tracks.move_to_end(key)
+            return track
+
+    def put(self, key: Hashable, track: Track):
+        with self.lock:
+            self.tracks[key] = track
+            self.tracks.move_to_end(key)
+            if len(self.tracks) > self.max_size:
+                self.tracks.popitem(last=False)
+
+    def evict(self, match: 'Callable[[Hashable], bool]'):
+        """Drop every track whose key matches, e.g. the tracks of a library that changed."""
+        with self.lock:
+            for key in [key for key in self.tracks if match(key)]:
+                del self.tracks[key]
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self) -> str:
+        return f'TrackCache(size={len(self.tracks)}/{self.max_size}, hits={self.hits}, misses={self.misses})'
+
+class PlaylistSelection:
+    """Case-insensitive set of requested playlist names, consumed as each one is found. None selects every playlist."""
+    def __init__(self, names: 'Iterable[str] | None'):
+        self.remaining = None if names is None else set(name.lower() for name in names)
+
+    def wants(self, name: str) -> bool:
+        return self.remaining is None or name.lower() in self.remaining
+
+    def take(self, name: str) -> bool:
+        if not self.wants(name):
+            return False
+        if self.remaining is not None:
+            self.remaining.remove(name.lower())
+        return True
+
+    @property
+    def done(self) -> bool:
+        return self.remaining is not None and not self.remaining
+
 class PlaylistReader(ABC):
     @abstractmethod
     def read_track(self) -> Track:
         pass
 
     @abstractmethod
-    def read_playlists(self) -> Generator[Playlist, None, None]:
+    def read_tracks(self) -> Generator[Track, None, None]:
+        """Yield every track of the library, including the tracks that are in no playlist."""
+        pass
+
+    @abstractmethod
+    def read_playlists(self, names: 'Iterable[str] | None' = None) -> Generator[Playlist, None, None]:
+        """Yield every playlist, or only the first one matching each of names, stopping once all of them were found."""
+        pass
+
+    @abstractmethod
+    def list_playlist_names(self) -> 'list[str]':
         pass
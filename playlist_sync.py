@@ -0,0 +1,438 @@
+"""
+Command line entry point, run as `python -m playlist_sync sync|list|probe|dump`.
+Each command imports only the readers it needs, so quick commands start fast and importing this module has no side effects.
+"""
+from pathlib import Path
+from typing import TYPE_CHECKING, Generator
+import argparse
+import json
+import sys
+
+if TYPE_CHECKING:
+    # Only for the annotations; the commands import these when they run
+    from playlist import Playlist, PlaylistReader
+    from applemusic import LibraryProbe
+    from merge import MergeIndex
+
+SCRIPT_DIR = Path(__file__).parent
+
+# The sources in order of precedence: with two playlists of the same name, the first source's is synced
+SOURCES = {
+    'Apple Music': 'Apple Music Library Path',
+    'iTunes': 'iTunes Library Path',
+}
+
+def load_settings(path: Path = SCRIPT_DIR / 'settings.json') -> dict:
+    with path.open('r') as inf:
+        return json.load(inf)
+
+def read_key(keyfile: Path = SCRIPT_DIR / 'itunes-key.txt') -> bytes:
+    assert keyfile.exists(), f"Missing keyfile at {keyfile}"
+    with keyfile.open('r') as inf:
+        return inf.read().strip().encode('ascii')
+
+def library_paths(settings: dict) -> 'dict[str, Path]':
+    """The configured libraries by source; either library may be left out of the settings."""
+    return {source: Path(settings[setting]) for source, setting in SOURCES.items() if settings.get(setting)}
+
+class PlaylistSync:
+    """Syncs the configured playlists from the libraries to every output, keeping the loaded libraries for the next sync."""
+    def __init__(self, settings: dict, key: 'bytes | None' = None, cache_path: Path = SCRIPT_DIR / 'library-cache.db',
+                 stats=None, keep_parsed: bool = False):
+        from playlist import TrackCache
+        from locations import LocationMapper
+        from stats import NullStats
+        from writers import WRITERS, ZPLWriter
+        from smart import SmartPlaylist
+
+        self.settings = settings
+        self.key = key
+        self.cache_path = cache_path
+        self.stats = stats if stats is not None else NullStats()
+        self.libraries = library_paths(settings)
+        self.playlist_names = set(plist.lower() for plist in settings['Playlists'])
+        self.smart_playlists = [SmartPlaylist.from_settings(smart) for smart in settings.get('Smart Playlists', [])]
+        # The writers are kept between syncs, along with the rendered tracks they memoize
+        self.output_writers = [(Path(settings['Groove Playlist Directory']), ZPLWriter())]
+        self.output_writers += [(Path(extra['Directory']), WRITERS[extra['Format']]()) for extra in settings.get('Outputs', [])]
+        self.track_cache = TrackCache(settings.get('Track Cache Size', 100_000))
+        self.location_mapper = LocationMapper(settings.get('Location Rewrites', {}))
+
+        # Loaded libraries stay in memory between syncs, until their file changes
+        self.readers: 'dict[str, PlaylistReader]' = {}
+        # A snapshot of the last parsed Apple Music library, whose unchanged tracks and playlists the next parse reuses
+        self.keep_parsed = keep_parsed
+        self.parsed = {}
+
+    # The loaders run on worker threads, and each needs its own SQLite connection to the cache
+    def load_applemusic(self) -> 'PlaylistReader':
+        from applemusic import AppleMusicReader, AppleMusicLibraryDecryptor
+        from cache import LibraryCache, LibraryFingerprint
+
+        library = self.libraries['Apple Music']
+        stats = self.stats
+        cache = LibraryCache(self.cache_path)
+        with stats.stage('applemusic_cache_load'):
+            applemusic = cache.load('Apple Music', library, self.track_cache)
+        if applemusic is None:
+            stats.add('library_cache_misses')
+            fingerprint = LibraryFingerprint.take(library)
+            decryptor = AppleMusicLibraryDecryptor(self.key, library)
+            with decryptor.open() as inf:
+                with stats.stage('applemusic_decrypt'):
+                    buffer = AppleMusicReader.read_file(inf)
+                with stats.stage('applemusic_index'):
+                    reader = AppleMusicReader.load_buffer(buffer, self.track_cache, self.settings.get('Parse Workers', 1),
+                                                          self.parsed.get('Apple Music'), self.keep_parsed)
+            # Decoded up front so the report tells it apart from storing the tracks in the cache
+            with stats.stage('applemusic_track_decode'):
+                reader.decode_tracks()
+            if self.keep_parsed:
+                self.parsed['Apple Music'] = reader.snapshot()
+            if stats.enabled:
+                stats.add('bytes_read', fingerprint.size)
+                stats.add('bytes_decrypted', len(reader.index.buffer))
+                stats.add('applemusic_tracks', len(reader.track_spans))
+                stats.count_sections('Apple Music', reader.index.signature_counts())
+            with stats.stage('applemusic_cache_store'):
+                applemusic = cache.store('Apple Music', library, reader, self.track_cache, fingerprint)
+        else:
+            stats.add('library_cache_hits')
+        return applemusic
+
+    def load_itunes(self) -> 'PlaylistReader':
+        from itunes import iTunesReader
+        from cache import LibraryCache
+
+        library = self.libraries['iTunes']
+        stats = self.stats
+        cache = LibraryCache(self.cache_path)
+        with stats.stage('itunes_cache_load'):
+            itunes = cache.load('iTunes', library, self.track_cache)
+        if itunes is None:
+            stats.add('library_cache_misses')
+            # The XML is parsed lazily, while the cache reads it back
+            with stats.stage('itunes_parse_store'):
+                itunes = cache.store('iTunes', library, iTunesReader(library, self.track_cache), self.track_cache)
+            if stats.enabled:
+                stats.add('bytes_read', library.stat().st_size)
+        else:
+            stats.add('library_cache_hits')
+        return itunes
+
+    def loader(self, source: str):
+        load = self.load_applemusic if source == 'Apple Music' else self.load_itunes
+        def load_warm() -> 'PlaylistReader':
+            if source not in self.readers:
+                self.readers[source] = load()
+            return self.readers[source]
+        return load_warm
+
+    def probe(self) -> 'LibraryProbe | None':
+        """Check the Apple Music library is complete and readable with the key, in milliseconds; raises ValueError if not."""
+        if 'Apple Music' not in self.libraries:
+            return None
+        from applemusic import AppleMusicLibraryDecryptor
+        return AppleMusicLibraryDecryptor(self.key, self.libraries['Apple Music']).probe()
+
+    def library_changed(self, library: Path):
+        """Forget a library that changed on disk, so the next sync loads it again."""
+        for source, path in self.libraries.items():
+            if path == library:
+                self.readers.pop(source, None)
+                # The cached tracks of a changed library may be stale, and the cache reuses row ids
+                self.track_cache.evict(lambda key: source in key or str(library) in key)
+
+    def resolve_smart_playlists(self, merge_index: 'MergeIndex') -> 'Generator[Playlist, None, None]':
+        """Query the library cache for each smart playlist; the loaders have stored every library by the time this runs."""
+        from cache import LibraryCache
+
+        cache = LibraryCache(self.cache_path)
+        for smart in self.smart_playlists:
+            with self.stats.stage('smart_query'):
+                plist = smart.resolve(cache, self.libraries, merge_index)
+            yield plist
+
+    def run(self) -> bool:
+        """Sync once, returning False if the sync was aborted because of missing files."""
+        from output import PlaylistOutput
+        from validation import LocationValidator
+        from pipeline import resolve_playlists
+        from merge import MergeIndex
+        import itertools
+
+        stats = self.stats
+        io_workers = self.settings.get('Write Workers', 4)
+        configured = self.playlist_names | set(smart.name.lower() for smart in self.smart_playlists)
+        outputs = [PlaylistOutput(directory, writer, io_workers, configured) for directory, writer in self.output_writers]
+        validator = LocationValidator(self.settings.get('Missing Files', 'warn'), self.settings.get('Validation Workers', 16))
+
+        # With the fail policy nothing may be written until every playlist was checked, so hold them until then
+        held: 'list[Playlist]' = []
+        write_early = validator.policy != 'fail'
+
+        merge_index = MergeIndex(self.location_mapper)
+        loaders = [self.loader(source) for source in self.libraries]
+        playlists = resolve_playlists(loaders, self.playlist_names, merge_index)
+        try:
+            for playlist in itertools.chain(playlists, self.resolve_smart_playlists(merge_index)):
+                stats.add('playlists_resolved')
+                stats.add('tracks_resolved', len(playlist.tracks))
+                with stats.stage('validate'):
+                    checked_playlists = validator.validate([playlist])
+                if not write_early:
+                    held += checked_playlists
+                    continue
+                with stats.stage('write'):
+                    for checked in checked_playlists:
+                        for output in outputs:
+                            output.write(checked)
+        except BaseException:
+            # Watch mode carries on after a failed sync, so its pools must not be left running
+            validator.close()
+            for output in outputs:
+                output.close()
+            raise
+
+        if merge_index.conflicts:
+            print(merge_index.summary())
+
+        if stats.enabled:
+            stats.add('merged_tracks', len(merge_index.tracks))
+            stats.add('merge_conflicts', len(merge_index.conflicts))
+            stats.add('files_checked', len(validator.results))
+            stats.add('files_missing', len(validator.missing))
+
+        try:
+            validator.finish()
+        except FileNotFoundError as e:
+            print(e)
+            for output in outputs:
+                output.close()
+            return False
+
+        with stats.stage('write'):
+            for checked in held:
+                for output in outputs:
+                    output.write(checked)
+
+        for output in outputs:
+            with stats.stage('write'):
+                result = output.finish()
+            stats.add('bytes_written', result.bytes_written)
+            stats.add('playlists_written', len(result.written))
+            print(f'{output.writer.name} playlists: {result}')
+        return True
+
+    def reset_stats(self, stats):
+        """Start counting a new sync into stats."""
+        self.stats = stats
+        self.track_cache.hits = 0
+        self.track_cache.misses = 0
+
+    def write_stats(self, path: 'str | None'):
+        stats = self.stats
+        if stats.enabled:
+            stats.hit_rate('track_cache', self.track_cache.hit_rate)
+            library_lookups = stats.counters['library_cache_hits'] + stats.counters['library_cache_misses']
+            stats.hit_rate('library_cache', stats.counters['library_cache_hits'] / library_lookups if library_lookups else 0.0)
+            if path == '-':
+                json.dump(stats.report(), sys.stdout, indent=4)
+                print()
+            else:
+                with open(path, 'w') as outf:
+                    json.dump(stats.report(), outf, indent=4)
+
+def check_libraries(settings: dict) -> 'dict[str, Path]':
+    libraries = library_paths(settings)
+    if not libraries:
+        print(f"No library configured, set {' or '.join(SOURCES.values())}!")
+        exit(1)
+    for source, library in libraries.items():
+        if not library.is_file():
+            print(f"Could not find {source} library!")
+            exit(1)
+    return libraries
+
+def sync(args: argparse.Namespace):
+    from stats import SyncStats, NullStats
+    from writers import WRITERS
+
+    settings = load_settings()
+    libraries = check_libraries(settings)
+
+    if not Path(settings['Groove Playlist Directory']).is_dir():
+        print("Invalid Groove playlist directory!")
+        exit(1)
+
+    for extra in settings.get('Outputs', []):
+        if extra['Format'] not in WRITERS:
+            print(f"Unknown playlist format \"{extra['Format']}\", expected one of {', '.join(WRITERS)}")
+            exit(1)
+        if not Path(extra['Directory']).is_dir():
+            print(f"Invalid {extra['Format']} playlist directory!")
+            exit(1)
+
+    names = set(plist.lower() for plist in settings['Playlists'])
+    for smart in settings.get('Smart Playlists', []):
+        name = str(smart.get('Name', '')).lower()
+        if name in names:
+            print(f"Playlist \"{smart['Name']}\" is listed more than once in Playlists and Smart Playlists!")
+            exit(1)
+        names.add(name)
+
+    key = read_key() if 'Apple Music' in libraries else None
+    stats = SyncStats() if args.stats is not None else NullStats()
+    try:
+        syncer = PlaylistSync(settings, key, stats=stats, keep_parsed=args.watch)
+    except ValueError as e:
+        print(e)
+        exit(1)
+
+    try:
+        syncer.probe()
+    except ValueError as e:
+        print(e)
+        exit(1)
+
+    succeeded = syncer.run()
+    syncer.write_stats(args.stats)
+    if not args.watch:
+        if not succeeded:
+            exit(1)
+        return
+
+    from watch import LibraryWatcher
+    watcher = LibraryWatcher(libraries.values(), settings.get('Watch Debounce', 0.5), settings.get('Watch Poll Interval', 1.0))
+    print('Watching the libraries for changes, press Ctrl+C to stop')
+    pending: 'set[Path]' = set()
+    try:
+        for changed in watcher.changes():
+            pending |= changed
+            if libraries.get('Apple Music') in changed:
+                try:
+                    syncer.probe()
+                except ValueError as e:
+                    # Most likely still being written; the write that completes it wakes us up again
+                    print(f'{e}, waiting for it to change again')
+                    continue
+            for library in pending:
+                syncer.library_changed(library)
+            print(f"{', '.join(library.name for library in pending)} changed, syncing")
+            pending.clear()
+            # Each report covers one sync, not everything since the watch started
+            syncer.reset_stats(SyncStats() if args.stats is not None else NullStats())
+            try:
+                syncer.run()
+            except Exception as e:
+                # E.g. a library saved halfway; the next change to it syncs again
+                print(f'Sync failed: {e!r}, waiting for the libraries to change again')
+                continue
+            syncer.write_stats(args.stats)
+    except KeyboardInterrupt:
+        pass
+
+def list_playlists(args: argparse.Namespace):
+    from cache import LibraryCache
+
+    settings = load_settings()
+    libraries = check_libraries(settings)
+    cache = LibraryCache(SCRIPT_DIR / 'library-cache.db')
+
+    for source, library in libraries.items():
+        if args.source is not None and source != args.source:
+            continue
+        # Use the cache if it is current, but don't fill it: listing only needs the names
+        reader = cache.load(source, library)
+        if reader is None and source == 'Apple Music':
+            from applemusic import AppleMusicReader, AppleMusicLibraryDecryptor
+            with AppleMusicLibraryDecryptor(read_key(), library).open() as inf:
+                reader = AppleMusicReader.load_file(inf)
+        elif reader is None:
+            from itunes import iTunesReader
+            reader = iTunesReader(library)
+
+        print(f'{source}:')
+        for name in reader.list_playlist_names():
+            print(f'  {name}')
+
+def probe(args: argparse.Namespace):
+    from applemusic import AppleMusicLibraryDecryptor
+
+    settings = load_settings()
+    library = args.library if args.library is not None else library_paths(settings).get('Apple Music')
+    if library is None or not library.is_file():
+        print("Could not find Apple Music library!")
+        exit(1)
+
+    try:
+        result = AppleMusicLibraryDecryptor(read_key(), library).probe(args.playlists)
+    except ValueError as e:
+        print(e)
+        exit(1)
+    print(f'Version: {result.version}')
+    print(f'Envelope: {result.envelope_length} bytes, file {result.file_size} bytes, encrypted {result.crypt_size} bytes')
+    print(f'Tracks: {result.track_count}')
+    if args.playlists:
+        print(f'Playlists: {result.playlist_count}')
+
+def dump(args: argparse.Namespace):
+    """Write the decrypted library and a description of its sections, tracks and playlists, for debugging the parser."""
+    from applemusic import AppleMusicReader, AppleMusicLibraryDecryptor, format_track_id
+    import shutil
+
+    library = args.library if args.library is not None else SCRIPT_DIR / 'Library.musicdb'
+    assert library.is_file(), f"Could not find {library}"
+    output = args.output
+    output.mkdir(parents=True, exist_ok=True)
+
+    decrypted = output / (library.name + '.bin')
+    with decrypted.open('wb') as outf, AppleMusicLibraryDecryptor(read_key(), library).open(True) as inf:
+        shutil.copyfileobj(inf, outf)
+
+    with decrypted.open('rb') as inf:
+        reader = AppleMusicReader.load_file(inf)
+
+    with (output / 'DEBUG_chunks.txt').open('w', encoding='utf-8') as outf:
+        for chunk in reader.chunks:
+            print(chunk, file=outf)
+
+    with (output / 'DEBUG_tracks.txt').open('w', encoding='utf-8') as outf:
+        for id, track in reader.tracks.items():
+            print(f'{format_track_id(id)} - {str(track)}', file=outf)
+
+    with (output / 'DEBUG_playlists.txt').open('w', encoding='utf-8') as outf:
+        for plist in reader.read_playlists():
+            print(plist, file=outf)
+            print(file=outf)
+
+def main(argv: 'list[str] | None' = None):
+    parser = argparse.ArgumentParser(prog='playlist_sync', description='Copy iTunes and Apple Music playlists into Groove Music.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = commands.add_parser('sync', help='sync the configured playlists')
+    sync_parser.add_argument('--stats', '--profile', nargs='?', const='-', metavar='PATH',
+                             help='write a JSON report of per-stage timings and counters to PATH, or stdout if no path is given')
+    sync_parser.add_argument('--watch', action='store_true', help='keep running and sync again whenever a library changes')
+    sync_parser.set_defaults(run=sync)
+
+    list_parser = commands.add_parser('list', help='list the playlists of each library')
+    list_parser.add_argument('--source', choices=list(SOURCES), help='only list the playlists of this library')
+    list_parser.set_defaults(run=list_playlists)
+
+    probe_parser = commands.add_parser('probe', help='check that the Apple Music library is readable and count its tracks, without parsing it')
+    probe_parser.add_argument('library', nargs='?', type=Path, help='the library to probe (default the one in settings.json)')
+    probe_parser.add_argument('--playlists', action='store_true', help='also count the playlists, which decompresses the whole library')
+    probe_parser.set_defaults(run=probe)
+
+    dump_parser = commands.add_parser('dump', help='decrypt an Apple Music library and describe its contents')
+    dump_parser.add_argument('library', nargs='?', type=Path, help='the library to dump (default Library.musicdb next to this script)')
+    dump_parser.add_argument('--output', type=Path, default=SCRIPT_DIR, help='directory to write the dump to (default next to this script)')
+    dump_parser.set_defaults(run=dump)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+# Parse workers re-import this module on platforms that spawn processes
+if __name__ == '__main__':
+    main()
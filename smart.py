@@ -0,0 +1,90 @@
+from typing import Iterable
+from playlist import Playlist, Track
+from cache import LibraryCache
+from merge import MergeIndex
+
+class SmartRule:
+    """One condition of a smart playlist, e.g. `["Duration", "<", 600]`, turned into an SQL condition on the tracks table."""
+    FIELDS = {
+        'Name': 'track_name',
+        'Artist': 'track_artist',
+        'Album': 'album_name',
+        'Album Artist': 'album_artist',
+        'Location': 'location',
+        'Duration': 'duration',
+    }
+    OPERATORS = ('=', '!=', '<', '<=', '>', '>=', 'contains', 'starts with')
+
+    def __init__(self, field: str, operator: str, value: 'str | int | float'):
+        if field not in SmartRule.FIELDS:
+            raise ValueError(f"Unknown smart playlist field \"{field}\", expected one of {', '.join(SmartRule.FIELDS)}")
+        if operator not in SmartRule.OPERATORS:
+            raise ValueError(f"Unknown smart playlist operator \"{operator}\", expected one of {', '.join(SmartRule.OPERATORS)}")
+        if field == 'Duration':
+            if not isinstance(value, (int, float)) or operator in ('contains', 'starts with'):
+                raise ValueError(f'Smart playlist durations are compared to a number of seconds, not "{operator} {value}"')
+        elif not isinstance(value, str):
+            raise ValueError(f'Smart playlist field "{field}" is compared to text, not {value}')
+        self.field = field
+        self.operator = operator
+        self.value = value
+
+    @staticmethod
+    def _like_pattern(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    def sql(self) -> 'tuple[str, list]':
+        column = SmartRule.FIELDS[self.field]
+        match self.operator:
+            case 'contains':
+                return f"{column} LIKE ? ESCAPE '\\'", ['%' + self._like_pattern(self.value) + '%']
+            case 'starts with':
+                return f"{column} LIKE ? ESCAPE '\\'", [self._like_pattern(self.value) + '%']
+        # Durations are stored in milliseconds
+        if column == 'duration':
+            return f'duration {self.operator} ?', [round(self.value * 1000)]
+        # Same collation as the index on the column, so the index can be used
+        return f'{column} COLLATE NOCASE {self.operator} ?', [self.value]
+
+    def __str__(self) -> str:
+        return f'{self.field} {self.operator} {self.value!r}'
+
+class SmartPlaylist:
+    """A playlist of every track, in any library, that matches all of its rules."""
+    def __init__(self, name: str, rules: 'list[SmartRule]'):
+        self.name = name
+        self.rules = rules
+
+    @staticmethod
+    def from_settings(settings: dict) -> 'SmartPlaylist':
+        """Read one entry of the `Smart Playlists` setting, e.g. `{"Name": ..., "Rules": [["Album Artist", "=", "X"]]}`."""
+        if not settings.get('Name'):
+            raise ValueError('Smart playlist without a name')
+        rules = settings.get('Rules')
+        if not rules:
+            raise ValueError(f"Smart playlist \"{settings['Name']}\" has no rules")
+        if any(not isinstance(rule, list) or len(rule) != 3 for rule in rules):
+            raise ValueError(f"Smart playlist \"{settings['Name']}\" rules must be [field, operator, value] lists")
+        return SmartPlaylist(settings['Name'], [SmartRule(*rule) for rule in rules])
+
+    @staticmethod
+    def _order(track: Track) -> tuple:
+        return tuple((value or '').casefold() for value in (track.album_artist, track.album_name, track.location_str))
+
+    def resolve(self, cache: LibraryCache, sources: 'Iterable[str]', merge_index: MergeIndex) -> Playlist:
+        """
+        Query the cached libraries for the matching tracks, sorted by album artist, album and location.
+        Tracks that several libraries have are only listed once, with the details of the first library.
+        """
+        conditions, parameters = [], []
+        for rule in self.rules:
+            condition, values = rule.sql()
+            conditions.append(condition)
+            parameters += values
+
+        rows: 'set[int]' = set()
+        for rank, source in enumerate(sources):
+            for track in cache.find_tracks(source, conditions, parameters):
+                rows.add(merge_index.add(track, rank))
+        tracks = sorted((merge_index.tracks[row] for row in rows), key=SmartPlaylist._order)
+        return Playlist(self.name, tracks)
@@ -0,0 +1,82 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Mapping
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where the report leaves out the peak RSS
+    resource = None
+
+class SyncStats:
+    """Wall time per stage and counters for one sync, reported as JSON with --stats."""
+    enabled = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: 'defaultdict[str, float]' = defaultdict(float)
+        self.counters: 'Counter[str]' = Counter()
+        self.sections: 'dict[str, dict[str, int]]' = {}
+        self.cache_hit_rates: 'dict[str, float]' = {}
+        # Both libraries are loaded on their own threads
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage; stages entered several times (or from several threads) add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stages[name] += elapsed
+
+    def add(self, name: str, count: int = 1):
+        with self.lock:
+            self.counters[name] += count
+
+    def count_sections(self, source: str, counts: 'Mapping[str, int]'):
+        with self.lock:
+            self.sections[source] = dict(counts)
+
+    def hit_rate(self, name: str, rate: float):
+        self.cache_hit_rates[name] = rate
+
+    @staticmethod
+    def peak_rss() -> 'int | None':
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    def report(self) -> dict:
+        return {
+            'total_seconds': round(time.perf_counter() - self.started, 4),
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'counters': dict(self.counters),
+            'sections': self.sections,
+            'cache_hit_rates': self.cache_hit_rates,
+            'peak_rss_bytes': self.peak_rss(),
+        }
+
+class NullStats:
+    """Stands in for SyncStats when --stats is not given, so the hooks do no work."""
+    enabled = False
+    _stage = nullcontext()
+
+    def stage(self, name: str):
+        return NullStats._stage
+
+    def add(self, name: str, count: int = 1):
+        pass
+
+    def count_sections(self, source: str, counts: 'Mapping[str, int]'):
+        pass
+
+    def hit_rate(self, name: str, rate: float):
+        pass
@@ -0,0 +1,67 @@
+from pathlib import Path
+from typing import Iterable
+from playlist import Playlist
+from concurrent.futures import ThreadPoolExecutor
+
+class LocationValidator:
+    """Checks that track files exist, stat-ing each unique location once and in parallel (slow shares benefit most)."""
+    POLICIES = ('fail', 'skip', 'warn')
+    SUMMARY_LIMIT = 20
+
+    def __init__(self, policy: str = 'warn', workers: int = 16):
+        assert policy in LocationValidator.POLICIES, f'Unknown missing file policy "{policy}", expected one of {LocationValidator.POLICIES}'
+        self.policy = policy
+        self.workers = workers
+        # One pool for every check of the sync; its threads are only started once there is something to stat
+        self.pool = ThreadPoolExecutor(workers)
+        self.results: 'dict[Path, bool]' = {}
+        self.missing: 'set[Path]' = set()
+
+    @staticmethod
+    def _exists(location: Path) -> bool:
+        return location is not None and location.is_file()
+
+    def check(self, locations: 'Iterable[Path]') -> 'set[Path]':
+        """Return the locations that are not files, only stat-ing the ones not seen before."""
+        locations = set(locations)
+        unchecked = [location for location in locations if location not in self.results]
+        if unchecked:
+            for location, exists in zip(unchecked, self.pool.map(self._exists, unchecked)):
+                self.results[location] = exists
+        return {location for location in locations if not self.results[location]}
+
+    def summary(self, missing: 'set[Path]') -> str:
+        listed = sorted(str(location) for location in missing)
+        lines = [f'{len(listed)} track files are missing:']
+        lines += ['  ' + location for location in listed[:LocationValidator.SUMMARY_LIMIT]]
+        if len(listed) > LocationValidator.SUMMARY_LIMIT:
+            lines.append(f'  ... and {len(listed) - LocationValidator.SUMMARY_LIMIT} more')
+        return '\n'.join(lines)
+
+    def validate(self, playlists: 'list[Playlist]') -> 'list[Playlist]':
+        """Apply the policy to playlists as they are resolved; call finish() once all of them were validated."""
+        missing = self.check(track.location for plist in playlists for track in plist.tracks)
+        self.missing |= missing
+
+        if self.policy == 'fail' and self.missing:
+            # Keep checking the remaining playlists so the summary is complete, but stop passing them on
+            return []
+        if self.policy == 'skip' and missing:
+            return [Playlist(plist.name, [track for track in plist.tracks if track.location not in missing]) for plist in playlists]
+        return playlists
+
+    def close(self):
+        self.pool.shutdown()
+
+    def finish(self):
+        self.close()
+        if not self.missing:
+            return
+
+        match self.policy:
+            case 'fail':
+                raise FileNotFoundError(self.summary(self.missing))
+            case 'skip':
+                print(self.summary(self.missing) + '\nSkipped these tracks.')
+            case _:
+                print(self.summary(self.missing))
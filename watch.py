@@ -0,0 +1,121 @@
+from pathlib import Path
+from typing import Generator, Iterable
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+class InotifyWatcher:
+    """Reports writes to the given files through inotify, watching their directories so replaced files are seen too."""
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_Q_OVERFLOW = 0x4000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, paths: 'Iterable[Path]'):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        # Events name the resolved file, but changes are reported with the paths as given
+        self.paths = {path.resolve(): path for path in paths}
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.directories: 'dict[int, Path]' = {}
+        for directory in set(path.parent for path in self.paths):
+            wd = libc.inotify_add_watch(self.fd, bytes(directory), InotifyWatcher.MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(errno, f'Could not watch {directory}')
+            self.directories[wd] = directory
+
+    def read(self, timeout: float) -> 'set[Path]':
+        """Wait up to timeout seconds and return the watched files that were written in the meantime."""
+        changed = set()
+        deadline = time.monotonic() + timeout
+        # Writes to other files in the watched directories wake us up too, so keep waiting until the deadline
+        while not changed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.fd], [], [], remaining)[0]:
+                break
+
+            events = os.read(self.fd, 64 * 1024)
+            offset = 0
+            while offset < len(events):
+                wd, mask, _, name_length = InotifyWatcher.EVENT_HEADER.unpack_from(events, offset)
+                offset += InotifyWatcher.EVENT_HEADER.size
+                name = events[offset:offset+name_length].rstrip(b'\0')
+                offset += name_length
+                if mask & InotifyWatcher.IN_Q_OVERFLOW:
+                    # Events were dropped while a long sync ran, so any of the files may have changed
+                    changed.update(self.paths.values())
+                    continue
+                path = self.directories[wd] / os.fsdecode(name)
+                if path in self.paths:
+                    changed.add(self.paths[path])
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Reports writes to the given files by comparing their size and mtime, for platforms without inotify."""
+    def __init__(self, paths: 'Iterable[Path]', interval: float = 1.0):
+        self.paths = set(paths)
+        self.interval = interval
+        self.stats = {path: self._stat(path) for path in self.paths}
+
+    @staticmethod
+    def _stat(path: Path) -> 'tuple[int, int] | None':
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def read(self, timeout: float) -> 'set[Path]':
+        time.sleep(min(timeout, self.interval))
+        changed = set()
+        for path in self.paths:
+            stat = self._stat(path)
+            if stat != self.stats[path]:
+                self.stats[path] = stat
+                changed.add(path)
+        return changed
+
+    def close(self):
+        pass
+
+class LibraryWatcher:
+    """Yields the library files that changed, once a burst of writes has been quiet for the debounce time."""
+    def __init__(self, paths: 'Iterable[Path]', debounce: float = 0.5, poll_interval: float = 1.0):
+        self.debounce = debounce
+        paths = list(paths)
+        self.watcher = None
+        if sys.platform.startswith('linux'):
+            try:
+                self.watcher = InotifyWatcher(paths)
+            except (OSError, AttributeError):
+                # No inotify (or no libc to call it through), so fall back to polling
+                pass
+        if self.watcher is None:
+            self.watcher = PollingWatcher(paths, poll_interval)
+
+    def changes(self) -> 'Generator[set[Path], None, None]':
+        try:
+            while True:
+                changed = self.watcher.read(3600)
+                if not changed:
+                    continue
+                # Apple Music and iTunes write their libraries in several steps; wait for them to settle
+                while more := self.watcher.read(self.debounce):
+                    changed |= more
+                yield changed
+        finally:
+            self.watcher.close()
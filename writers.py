@@ -0,0 +1,142 @@
+from abc import ABC, abstractmethod
+from pathlib import PurePath
+from typing import TextIO
+from urllib.parse import quote
+from playlist import Playlist, Track
+import html
+import io
+
+class PlaylistWriter(ABC):
+    """Streams one playlist in a player's file format."""
+    name: str
+    extension: str
+    # None keeps the platform default, which is what Groove has always been given
+    encoding: 'str | None' = 'utf-8'
+
+    @abstractmethod
+    def write(self, plist: Playlist, outf: TextIO):
+        pass
+
+    def begin(self):
+        """Called as each sync starts, as the writer is kept between syncs in watch mode."""
+        pass
+
+    def render(self, plist: Playlist) -> str:
+        """The whole file as a string, so it can be written on another thread."""
+        outf = io.StringIO()
+        self.write(plist, outf)
+        return outf.getvalue()
+
+class ZPLWriter(PlaylistWriter):
+    name = 'zpl'
+    extension = '.zpl'
+    encoding = None
+
+    header_template = """
+<?zpl version="2.0"?>
+<smil>
+  <head>
+    <meta name="generator" content="Entertainment Platform -- 10.22031.1009.0" />
+    <meta name="itemCount" content="{item_count}" />
+    <meta name="totalDuration" content="{total_duration_ms}" />
+    <title>{title}</title>
+  </head>
+  <body>
+    <seq>
+""".lstrip()
+
+    item_template = '      <media src="{src}" albumTitle="{album_title}" albumArtist="{album_artist}" trackTitle="{track_title}" trackArtist="{track_artist}" duration="{duration}" />\n'
+
+    footer = """    </seq>
+  </body>
+</smil>
+"""
+
+    def __init__(self):
+        # Escaped media line of each distinct track, as most tracks are in several playlists
+        self.items: 'dict[tuple, str]' = {}
+        # The lines of the previous sync; only those rendered again are kept, so edited and removed tracks are dropped
+        self.previous_items: 'dict[tuple, str]' = {}
+
+    def begin(self):
+        self.previous_items = self.items
+        self.items = {}
+
+    def _item(self, track: Track) -> str:
+        key = (track.location_str, track.album_name, track.album_artist, track.track_name, track.track_artist, track.duration)
+        item = self.items.get(key)
+        if item is None:
+            item = self.previous_items.pop(key, None)
+            if item is None:
+                item = self.item_template.format(
+                    src=html.escape(str(track.location)),
+                    album_title=html.escape(track.album_name),
+                    album_artist=html.escape(track.album_artist),
+                    track_title=html.escape(track.track_name),
+                    track_artist=html.escape(track.track_artist),
+                    duration=track.duration
+                )
+            self.items[key] = item
+        return item
+
+    def render(self, plist: Playlist) -> str:
+        header = self.header_template.format(
+            item_count=len(plist.tracks),
+            total_duration_ms=sum(track.duration for track in plist.tracks),
+            title=html.escape(plist.name)
+        )
+        items = ''.join(self._item(track) for track in plist.tracks) if plist.tracks else '\n'
+        return header + items + self.footer
+
+    def write(self, plist: Playlist, outf: TextIO):
+        outf.write(self.render(plist))
+
+class M3U8Writer(PlaylistWriter):
+    name = 'm3u8'
+    extension = '.m3u8'
+
+    def write(self, plist: Playlist, outf: TextIO):
+        outf.write(f'#EXTM3U\n#PLAYLIST:{plist.name}\n')
+        for track in plist.tracks:
+            seconds = round(track.duration / 1000) if track.duration is not None else -1
+            outf.write(f'#EXTINF:{seconds},{track.track_artist} - {track.track_name}\n{track.location}\n')
+
+class XSPFWriter(PlaylistWriter):
+    name = 'xspf'
+    extension = '.xspf'
+
+    @staticmethod
+    def _location_uri(track: Track) -> str:
+        location = PurePath(track.location)
+        if location.is_absolute():
+            return location.as_uri()
+        return quote(location.as_posix())
+
+    def write(self, plist: Playlist, outf: TextIO):
+        outf.write('<?xml version="1.0" encoding="UTF-8"?>\n<playlist version="1" xmlns="http://xspf.org/ns/0/">\n')
+        outf.write(f'  <title>{html.escape(plist.name)}</title>\n  <trackList>\n')
+        for track in plist.tracks:
+            outf.write('    <track>\n')
+            outf.write(f'      <location>{html.escape(self._location_uri(track))}</location>\n')
+            outf.write(f'      <title>{html.escape(track.track_name)}</title>\n')
+            outf.write(f'      <creator>{html.escape(track.track_artist)}</creator>\n')
+            outf.write(f'      <album>{html.escape(track.album_name)}</album>\n')
+            if track.duration is not None:
+                outf.write(f'      <duration>{track.duration}</duration>\n')
+            outf.write('    </track>\n')
+        outf.write('  </trackList>\n</playlist>\n')
+
+class WPLWriter(PlaylistWriter):
+    name = 'wpl'
+    extension = '.wpl'
+
+    def write(self, plist: Playlist, outf: TextIO):
+        outf.write('<?wpl version="1.0"?>\n<smil>\n    <head>\n')
+        outf.write('        <meta name="Generator" content="playlist-sync"/>\n')
+        outf.write(f'        <meta name="ItemCount" content="{len(plist.tracks)}"/>\n')
+        outf.write(f'        <title>{html.escape(plist.name)}</title>\n    </head>\n    <body>\n        <seq>\n')
+        for track in plist.tracks:
+            outf.write(f'            <media src="{html.escape(str(track.location))}"/>\n')
+        outf.write('        </seq>\n    </body>\n</smil>\n')
+
+WRITERS: 'dict[str, type[PlaylistWriter]]' = {writer.name: writer for writer in (ZPLWriter, M3U8Writer, XSPFWriter, WPLWriter)}